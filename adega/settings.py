@@ -54,6 +54,21 @@ DATABASES = {
     )
 }
 
+# ---- CACHE ----
+# Compartilhado entre os workers do gunicorn (catálogo do PDV). Em disco por padrão;
+# defina REDIS_URL para usar Redis quando houver mais de uma máquina.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', '/tmp/adega_cache'),
+    }
+}
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
 LANGUAGE_CODE = 'pt-br'
 TIME_ZONE = 'America/Sao_Paulo'
 USE_I18N = True
@@ -1,7 +1,12 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django.contrib import admin, messages
+from django.utils import timezone
+from django.utils.timesince import timesince
 from .models import (
-    CategoriaProduto, Produtos, Estoque, Venda, ItemVenda,
-    SaidaEstoque, CategoriaDespesas, Despesa, FinanceiroMes
+    CategoriaProduto, Produtos, ComponenteProduto, Estoque, Venda, ItemVenda,
+    SaidaEstoque, CategoriaDespesas, Despesa, FinanceiroMes, Tarefa, VendaDiaria,
+    MovimentoEstoque, SaldoEstoqueDia, PrevisaoDemanda
 )
 
 # ======================
@@ -18,14 +23,23 @@ class CategoriasProdutosAdmin(admin.ModelAdmin):
 # ============
 # PRODUTOS
 # ============
+class ComponenteProdutoInline(admin.TabularInline):
+    model = ComponenteProduto
+    fk_name = 'produto'
+    extra = 0
+    autocomplete_fields = ('componente',)
+    fields = ('componente', 'quantidade')
+
+
 @admin.register(Produtos)
 class ProdutosAdmin(admin.ModelAdmin):
-    list_display = ('nome_produto', 'categoria', 'preco_venda', 'preco_fornecedor', 'ganho_potencial', 'ativo')
+    list_display = ('nome_produto', 'categoria', 'preco_venda', 'preco_fornecedor', 'ganho_potencial', 'estoque_atual', 'ativo')
     search_fields = ('nome_produto', 'codigo')
     list_filter = ('categoria', 'ativo')
     ordering = ('nome_produto',)
     autocomplete_fields = ('categoria',)
-    readonly_fields = ('ganho_potencial',)
+    readonly_fields = ('ganho_potencial', 'estoque_atual', 'fracao_aberta')
+    inlines = [ComponenteProdutoInline]
 
 
 # ============
@@ -44,9 +58,9 @@ class EstoqueAdmin(admin.ModelAdmin):
 # ===================
 @admin.register(SaidaEstoque)
 class SaidaEstoqueAdmin(admin.ModelAdmin):
-    list_display = ('nome_produto', 'codigo_produto', 'quantidade', 'data_saida', 'ativo')
+    list_display = ('nome_produto', 'codigo_produto', 'quantidade', 'dia', 'data_saida', 'ativo')
     search_fields = ('nome_produto', 'codigo_produto')
-    list_filter = ('data_saida',)
+    list_filter = ('dia',)
     ordering = ('-data_saida',)
     readonly_fields = ('nome_produto', 'codigo_produto', 'data_saida')
 
@@ -168,3 +182,89 @@ class FinanceiroMesAdmin(admin.ModelAdmin):
             count += 1
         self.message_user(request, f"{count} fechamento(s) atualizado(s) com sucesso ✅")
 
+
+
+# ===================
+# RESUMO DIÁRIO DE VENDAS
+# ===================
+@admin.register(VendaDiaria)
+class VendaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'forma_pagamento', 'usuario', 'quantidade', 'total_bruto', 'total_liquido')
+    list_filter = ('forma_pagamento', 'usuario')
+    date_hierarchy = 'dia'
+    ordering = ('-dia',)
+    readonly_fields = ('quantidade', 'total_bruto', 'total_liquido', 'criacao', 'atualizado')
+
+
+# ===================
+# LIVRO DE ESTOQUE
+# ===================
+@admin.register(MovimentoEstoque)
+class MovimentoEstoqueAdmin(admin.ModelAdmin):
+    list_display = ('momento', 'produto', 'tipo', 'quantidade')
+    list_filter = ('tipo',)
+    search_fields = ('produto__nome_produto', 'produto__codigo')
+    date_hierarchy = 'momento'
+    ordering = ('-momento',)
+
+    # Só de inclusão: correções entram como novos ajustes
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SaldoEstoqueDia)
+class SaldoEstoqueDiaAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'produto', 'saldo')
+    search_fields = ('produto__nome_produto', 'produto__codigo')
+    date_hierarchy = 'dia'
+    ordering = ('-dia',)
+    readonly_fields = ('produto', 'dia', 'saldo', 'criacao', 'atualizado')
+
+
+@admin.register(PrevisaoDemanda)
+class PrevisaoDemandaAdmin(admin.ModelAdmin):
+    list_display = ('produto', 'media_diaria', 'demanda_semana', 'atualizado')
+    search_fields = ('produto__nome_produto', 'produto__codigo')
+    ordering = ('-media_diaria',)
+    readonly_fields = ('produto', 'demanda_semana', 'media_diaria', 'criacao', 'atualizado')
+
+
+# ===================
+# TAREFAS EM SEGUNDO PLANO
+# ===================
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'status', 'espera', 'tentativas', 'executar_em', 'atualizado')
+    list_filter = ('status', 'tipo')
+    search_fields = ('tipo', 'erro')
+    ordering = ('-criacao',)
+    readonly_fields = ('criacao', 'atualizado')
+
+    ALERTA_ESPERA = timedelta(minutes=5)  # pendente vencida há mais que isso: o worker não está rodando?
+
+    @admin.display(description="Esperando há")
+    def espera(self, obj):
+        if obj.status != 'pendente' or obj.executar_em > timezone.now():
+            return "-"
+        atraso = timezone.now() - obj.executar_em
+        return f"{'⚠️ ' if atraso > self.ALERTA_ESPERA else ''}{timesince(obj.executar_em)}"
+
+    def changelist_view(self, request, extra_context=None):
+        mais_antiga = (
+            Tarefa.objects.filter(status='pendente', executar_em__lte=timezone.now() - self.ALERTA_ESPERA)
+            .order_by('executar_em').values_list('executar_em', flat=True).first()
+        )
+        if mais_antiga:
+            self.message_user(
+                request,
+                f"Há tarefas pendentes esperando há {timesince(mais_antiga)}. "
+                "Confira se o worker (python manage.py processar_tarefas) está rodando.",
+                messages.WARNING,
+            )
+        return super().changelist_view(request, extra_context)
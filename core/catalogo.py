@@ -0,0 +1,196 @@
+"""
+Cache do catálogo (produtos e categorias) e das listas de estoque usadas pelas telas.
+
+Tudo fica no cache compartilhado (settings.CACHES) sob versões que mudam a cada gravação:
+"catalogo" (Produtos/CategoriaProduto) e "estoque" (lotes e saldos). Os workers do gunicorn
+leem as mesmas versões, então uma alteração feita em um deles invalida o cache de todos.
+Cada versão é o instante (em ns) da última alteração, o que também serve de Last-Modified.
+"""
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, When, IntegerField, Q
+
+from .models import Produtos, CategoriaProduto, Estoque, ComponenteProduto
+
+TEMPO_CACHE = 60 * 60 * 24
+
+# Categorias que não têm lote próprio: só abatem estoque pela receita (ComponenteProduto)
+CATEGORIAS_SEM_ESTOQUE = ["combos", "doses", "fracionados"]
+
+
+def versao(nome="catalogo"):
+    chave = f"{nome}:versao"
+    atual = cache.get(chave)
+    if atual is None:
+        cache.add(chave, time.time_ns(), None)
+        atual = cache.get(chave)
+    return atual
+
+
+def invalidar(nome="catalogo"):
+    """Troca a versão depois do commit (antes disso, outros workers ainda leem o dado antigo)."""
+    transaction.on_commit(lambda: cache.set(f"{nome}:versao", time.time_ns(), None))
+
+
+def em_cache(nome, gerar, versoes=("catalogo",)):
+    chave = ":".join([nome, *(str(versao(v)) for v in versoes)])
+    valor = cache.get(chave)
+    if valor is None:
+        valor = gerar()
+        cache.set(chave, valor, TEMPO_CACHE)
+    return valor
+
+
+def _dados_vender():
+    produtos = list(
+        Produtos.objects.select_related("categoria").order_by(
+            Case(
+                When(categoria__nome_categoria="Doses", then=0),
+                default=1,
+                output_field=IntegerField()
+            ),
+            'nome_produto'
+        )
+    )
+    gelos = [p for p in produtos if p.categoria.nome_categoria.lower() == "gelos"]
+    redbulls = sorted(
+        (p for p in produtos
+         if p.categoria.nome_categoria.lower() == "energeticos" and "redbull" in p.nome_produto.lower()),
+        key=lambda p: p.nome_produto,
+    )
+    categorias = list(
+        CategoriaProduto.objects.values_list("nome_categoria", flat=True).order_by("nome_categoria")
+    )
+    return {
+        "produtos": produtos,
+        "gelos": gelos,
+        "redbulls": redbulls,
+        "categorias": categorias,
+    }
+
+
+def dados_vender():
+    """Produtos (na ordem da tela de venda), gelos, Red Bulls e categorias."""
+    return em_cache("vender", _dados_vender)
+
+
+# Índice código de barras -> produto, por worker. Reconstruído a partir do catálogo em cache
+# sempre que a versão muda (cadastrar/editar/excluir produto), então a leitura é um dict.get.
+_indice_codigos = {"versao": None, "produtos": {}}
+
+
+def produto_por_codigo(codigo):
+    atual = versao()
+    if _indice_codigos["versao"] != atual:
+        _indice_codigos["produtos"] = {
+            p.codigo: p for p in dados_vender()["produtos"] if p.codigo
+        }
+        _indice_codigos["versao"] = atual
+    return _indice_codigos["produtos"].get(codigo)
+
+
+# Receitas expandidas por worker: produto composto -> {produto de estoque: quantidade por unidade},
+# reconstruída (duas consultas) quando a versão do catálogo muda. Receitas aninhadas (combo com
+# doses) já vêm resolvidas até os produtos de estoque, então o checkout só faz dict.get.
+_receitas = {"versao": None, "tabela": {}}
+
+
+def _sem_estoque(categoria):
+    return (categoria or "").lower() in CATEGORIAS_SEM_ESTOQUE
+
+
+def _montar_receitas():
+    componentes = defaultdict(list)
+    for produto_id, componente_id, quantidade in ComponenteProduto.objects.values_list(
+            "produto_id", "componente_id", "quantidade"):
+        componentes[produto_id].append((componente_id, quantidade))
+    categorias = dict(
+        Produtos.objects.filter(usado_em__isnull=False).distinct()
+        .values_list("pk", "categoria__nome_categoria")
+    )
+
+    tabela = {}
+
+    def expandir(produto_id, caminho):
+        if produto_id in tabela:
+            return tabela[produto_id]
+        if produto_id not in componentes:
+            return {} if _sem_estoque(categorias.get(produto_id)) else {produto_id: Decimal(1)}
+        total = defaultdict(Decimal)
+        for componente_id, quantidade in componentes[produto_id]:
+            if componente_id in caminho:  # receita circular: ignora o trecho que volta
+                continue
+            for base_id, base_qtd in expandir(componente_id, caminho | {componente_id}).items():
+                total[base_id] += quantidade * base_qtd
+        tabela[produto_id] = dict(total)
+        return tabela[produto_id]
+
+    for produto_id in componentes:
+        expandir(produto_id, {produto_id})
+    return tabela
+
+
+def receitas():
+    """
+    Tabela produto -> receita expandida até os produtos de estoque. Lê a versão uma vez só:
+    o checkout pega a tabela no início e a repassa, sem voltar ao cache a cada item.
+    """
+    atual = versao()
+    if _receitas["versao"] != atual:
+        _receitas["tabela"] = _montar_receitas()
+        _receitas["versao"] = atual
+    return _receitas["tabela"]
+
+
+def expansao_estoque(produto, tabela):
+    """
+    Quanto de cada produto de estoque sai por unidade vendida de `produto` ({produto_id: Decimal}):
+    a receita da `tabela` (retorno de receitas()), se houver; senão o próprio produto, exceto
+    doses/combos sem receita (nada).
+    """
+    expandida = tabela.get(produto.id)
+    if expandida is not None:
+        return expandida
+    return {} if _sem_estoque(produto.categoria.nome_categoria) else {produto.id: Decimal(1)}
+
+
+def _produtos_estoque_json():
+    produtos = Produtos.objects.exclude(
+        Q(categoria__nome_categoria__iexact="doses") | Q(categoria__nome_categoria__iexact="combos")
+    ).order_by('nome_produto').values(
+        "id", "nome_produto", "codigo", "imagem", "estoque_atual"
+    )
+    return json.dumps({"produtos": list(produtos)}, cls=DjangoJSONEncoder)
+
+
+def _lotes_estoque_json():
+    lotes = (
+        Estoque.objects
+        .exclude(
+            Q(produtos__categoria__nome_categoria__iexact="doses") |
+            Q(produtos__categoria__nome_categoria__iexact="combos")
+        )
+        .filter(quantidade__gt=0)
+        .order_by("lote", "quantidade")
+        .values(
+            "id", "produtos__id", "produtos__nome_produto", "produtos__codigo",
+            "produtos__imagem", "quantidade", "lote", "data_validade"
+        )
+    )
+    return json.dumps({"lotes": list(lotes)}, cls=DjangoJSONEncoder)
+
+
+def produtos_estoque_json():
+    """JSON (já serializado) dos produtos da tela de estoque, com o saldo atual."""
+    return em_cache("estoque_produtos", _produtos_estoque_json, ("catalogo", "estoque"))
+
+
+def lotes_estoque_json():
+    """JSON (já serializado) dos lotes com quantidade da tela de estoque."""
+    return em_cache("estoque_lotes", _lotes_estoque_json, ("catalogo", "estoque"))
@@ -0,0 +1,34 @@
+"""
+Períodos para filtrar campos DateTimeField sem converter a coluna.
+
+Filtros como `data__date`, `data__month` ou `data_saida__date__gte` aplicam uma função em
+cada linha e não usam índice. Aqui o período vira um intervalo semiaberto
+[início do primeiro dia, início do dia seguinte ao último), em horário local.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def periodo(campo, inicio=None, fim=None):
+    """
+    kwargs de filtro para `campo` entre os dias `inicio` e `fim` (inclusive; qualquer um pode ser None).
+    Ex.: Venda.objects.filter(**periodo("data", hoje, hoje)).
+    """
+    filtros = {}
+    if inicio is not None:
+        filtros[f"{campo}__gte"] = inicio_do_dia(inicio)
+    if fim is not None:
+        filtros[f"{campo}__lt"] = inicio_do_dia(fim + timedelta(days=1))
+    return filtros
+
+
+def dias_do_mes(mes, ano):
+    """Primeiro e último dia do mês (para `periodo` ou `__range` em DateField)."""
+    primeiro = date(ano, mes, 1)
+    proximo = date(ano + mes // 12, mes % 12 + 1, 1)
+    return primeiro, proximo - timedelta(days=1)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.previsao import gravar_previsoes
+
+
+class Command(BaseCommand):
+    help = "Recalcula a previsão de demanda por produto (PrevisaoDemanda) usada na lista de compras. Rodar toda noite."
+
+    def handle(self, *args, **options):
+        produtos = gravar_previsoes()
+        self.stdout.write(self.style.SUCCESS(f"Previsão recalculada para {produtos} produto(s)."))
@@ -0,0 +1,30 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import SaldoEstoqueDia
+
+
+class Command(BaseCommand):
+    help = (
+        "Tira a foto diária do saldo de estoque (SaldoEstoqueDia) a partir do livro de movimentos. "
+        "Rodar toda noite; dias sem foto desde a última são preenchidos em ordem."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dia", help="Último dia a fechar (AAAA-MM-DD). Padrão: ontem.")
+
+    def handle(self, *args, **options):
+        try:
+            ate = date.fromisoformat(options["dia"]) if options["dia"] else timezone.localdate() - timedelta(days=1)
+        except ValueError:
+            raise CommandError("Use --dia no formato AAAA-MM-DD.")
+
+        ultima = SaldoEstoqueDia.objects.filter(dia__lt=ate).order_by("-dia").values_list("dia", flat=True).first()
+        dia = ultima + timedelta(days=1) if ultima else ate
+        while dia <= ate:
+            produtos = SaldoEstoqueDia.fechar(dia)
+            self.stdout.write(f"{dia:%d/%m/%Y}: {produtos} produto(s) com saldo.")
+            dia += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Saldos fechados até {ate:%d/%m/%Y}."))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from core.models import ItemVenda, Produtos
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche custo_unitario e ganho_unitario dos itens de venda antigos, em lotes, "
+        "com os valores atuais de cada produto."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=2000, help="Itens atualizados por UPDATE.")
+
+    def handle(self, *args, **options):
+        produto = Produtos.objects.filter(pk=OuterRef("produto_id"))
+        pendentes = ItemVenda.objects.filter(ganho_unitario__isnull=True).order_by("pk")
+
+        total = 0
+        ultimo = 0
+        while True:
+            ids = list(pendentes.filter(pk__gt=ultimo).values_list("pk", flat=True)[:options["lote"]])
+            if not ids:
+                break
+            total += ItemVenda.objects.filter(pk__in=ids).update(
+                custo_unitario=Subquery(produto.values("preco_fornecedor")[:1]),
+                ganho_unitario=Coalesce(Subquery(produto.values("ganho_potencial")[:1]), Value(0)),
+            )
+            ultimo = ids[-1]
+            self.stdout.write(f"{total} item(ns) preenchido(s)...")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} item(ns) de venda com custo preenchido."))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import services  # noqa: F401 - registra as tarefas
+from core.tarefas import processar, liberar_travadas, limpar_concluidas
+
+
+class Command(BaseCommand):
+    help = "Worker das tarefas em segundo plano (saídas de estoque, limpeza de lotes zerados, fechamento mensal)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--uma-vez", action="store_true", help="Processa o que estiver vencido e sai.")
+        parser.add_argument("--intervalo", type=float, default=1.0, help="Espera (s) quando a fila está vazia.")
+        parser.add_argument("--lote", type=int, default=200, help="Máximo de tarefas reservadas por rodada.")
+
+    def handle(self, *args, **options):
+        liberadas = liberar_travadas()
+        if liberadas:
+            self.stdout.write(f"{liberadas} tarefa(s) interrompida(s) devolvida(s) para a fila.")
+
+        while True:
+            processadas = processar(options["lote"])
+            if processadas:
+                continue
+            if options["uma_vez"]:
+                break
+            limpar_concluidas()
+            time.sleep(options["intervalo"])
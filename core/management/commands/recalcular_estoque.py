@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from core.models import Produtos
+
+
+class Command(BaseCommand):
+    help = "Confere e reconstrói o saldo materializado (Produtos.estoque_atual) a partir dos lotes em Estoque."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Só lista os produtos com saldo divergente, sem corrigir (termina com erro se houver).",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            divergentes = list(
+                Produtos.objects.annotate(saldo_lotes=Produtos.saldo_real())
+                .exclude(estoque_atual=F("saldo_lotes"))
+                .select_for_update(of=("self",))
+                .order_by("pk")
+                .values_list("pk", "nome_produto", "estoque_atual", "saldo_lotes")
+            )
+
+            for pk, nome, atual, real in divergentes:
+                self.stdout.write(f"#{pk} {nome}: saldo {atual}, lotes {real}")
+
+            if options["verificar"]:
+                if divergentes:
+                    raise CommandError(f"{len(divergentes)} produto(s) com saldo divergente.")
+                self.stdout.write(self.style.SUCCESS("Todos os saldos conferem com os lotes."))
+                return
+
+            # Corrige pela diferença (com as linhas travadas) para o livro de estoque registrar o ajuste
+            Produtos.ajustar_estoque({pk: real - atual for pk, _nome, atual, real in divergentes})
+            self.stdout.write(self.style.SUCCESS(f"{len(divergentes)} saldo(s) corrigido(s)."))
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from core.models import FinanceiroMes, Venda, Despesa, Tarefa
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula do zero os fechamentos mensais (FinanceiroMes) e compara com os totais "
+        "mantidos incrementalmente a cada venda/despesa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mes", type=int, help="Mês a conferir (padrão: todos com movimento).")
+        parser.add_argument("--ano", type=int, help="Ano a conferir (padrão: todos com movimento).")
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Só lista os meses divergentes, sem corrigir (termina com erro se houver).",
+        )
+
+    def _meses(self, mes, ano):
+        meses = set(FinanceiroMes.objects.values_list("mes", "ano"))
+        for qs, campo in ((Venda.objects.all(), "data"), (Despesa.objects.filter(data__isnull=False), "data")):
+            meses.update(
+                qs.annotate(m=ExtractMonth(campo), a=ExtractYear(campo))
+                .order_by().values_list("m", "a").distinct()
+            )
+        return sorted(
+            (m, a) for m, a in meses
+            if (mes is None or m == mes) and (ano is None or a == ano)
+        )
+
+    def _pendentes(self, mes, ano):
+        """Variações do mês ainda na fila do worker (a venda já está gravada, o fechamento não)."""
+        return Tarefa.objects.filter(
+            tipo="fechamento", status__in=["pendente", "executando"], dados__mes=mes, dados__ano=ano
+        )
+
+    def _conferir(self, mes, ano, corrigir):
+        """
+        Confere (e, com `corrigir`, refaz) um mês. Vendas, despesas e a fila são lidas no mesmo
+        instante: o que o recálculo conta sai da fila junto, para o worker não somar de novo.
+        """
+        isolar = connection.vendor == "postgresql" and not connection.in_atomic_block
+        with transaction.atomic():
+            if isolar:
+                # Uma foto só do banco para o recálculo e para a fila (padrão seria READ COMMITTED)
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+            esperado = FinanceiroMes.calcular(mes, ano)
+            atual = FinanceiroMes.objects.filter(mes=mes, ano=ano).values(*esperado.keys()).first() or {}
+            pendentes = list(self._pendentes(mes, ano))
+            for tarefa in pendentes:
+                liquido, ganho, despesas = (Decimal(tarefa.dados[c]) for c in ("liquido", "ganho", "despesas"))
+                for campo, delta in (
+                    ("total_liquido", liquido), ("total_ganho_potencial", ganho), ("total_despesas", despesas),
+                    ("lucro_liquido", liquido - despesas), ("lucro_potencial", ganho - despesas),
+                ):
+                    atual[campo] = atual.get(campo, 0) + delta
+
+            diferencas = {
+                campo: (atual.get(campo, 0), valor)
+                for campo, valor in esperado.items()
+                if round(atual.get(campo, 0), 2) != round(valor, 2)
+            }
+            if diferencas and corrigir:
+                if any(t.status == "executando" for t in pendentes):
+                    raise CommandError(
+                        f"{mes:02d}/{ano}: o worker está aplicando variações deste mês agora; rode de novo."
+                    )
+                Tarefa.objects.filter(pk__in=[t.pk for t in pendentes]).delete()
+                FinanceiroMes.gerar_ou_atualizar(mes, ano)
+        return diferencas
+
+    def handle(self, *args, **options):
+        divergentes = 0
+        for mes, ano in self._meses(options["mes"], options["ano"]):
+            diferencas = self._conferir(mes, ano, corrigir=not options["verificar"])
+            if not diferencas:
+                continue
+
+            divergentes += 1
+            detalhes = ", ".join(f"{campo}: {a} -> {e}" for campo, (a, e) in diferencas.items())
+            self.stdout.write(f"{mes:02d}/{ano}: {detalhes}")
+
+        if options["verificar"] and divergentes:
+            raise CommandError(f"{divergentes} fechamento(s) divergente(s).")
+        acao = "divergente(s)" if options["verificar"] else "corrigido(s)"
+        self.stdout.write(self.style.SUCCESS(f"{divergentes} fechamento(s) {acao}."))
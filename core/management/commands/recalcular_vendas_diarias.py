@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import VendaDiaria
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula do zero o resumo diário de vendas (VendaDiaria) e compara com os totais "
+        "mantidos incrementalmente a cada venda."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verificar",
+            action="store_true",
+            help="Só lista os dias divergentes, sem corrigir (termina com erro se houver).",
+        )
+
+    def handle(self, *args, **options):
+        campos = ("quantidade", "total_bruto", "total_liquido")
+        chave = lambda linha: (linha["dia"], linha["forma_pagamento"], linha["usuario_id"])  # noqa: E731
+
+        esperado = {chave(linha): linha for linha in VendaDiaria.calcular()}
+        atual = {
+            chave(linha): linha
+            for linha in VendaDiaria.objects.values("dia", "forma_pagamento", "usuario_id", *campos)
+        }
+
+        divergentes = 0
+        for dia, forma, usuario_id in sorted(esperado.keys() | atual.keys(), key=lambda c: (c[0], c[1], c[2] or 0)):
+            e = esperado.get((dia, forma, usuario_id), {})
+            a = atual.get((dia, forma, usuario_id), {})
+            diferencas = {
+                campo: (a.get(campo, 0), e.get(campo, 0))
+                for campo in campos
+                if round(a.get(campo, 0), 2) != round(e.get(campo, 0), 2)
+            }
+            if diferencas:
+                divergentes += 1
+                detalhes = ", ".join(f"{campo}: {x} -> {y}" for campo, (x, y) in diferencas.items())
+                self.stdout.write(f"{dia:%d/%m/%Y} {forma} usuário {usuario_id}: {detalhes}")
+
+        if options["verificar"]:
+            if divergentes:
+                raise CommandError(f"{divergentes} linha(s) do resumo diário divergente(s).")
+        elif divergentes:
+            VendaDiaria.recalcular()
+        acao = "divergente(s)" if options["verificar"] else "corrigida(s)"
+        self.stdout.write(self.style.SUCCESS(f"{divergentes} linha(s) {acao}."))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:13
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_estoque_atual(apps, schema_editor):
+    Produtos = apps.get_model('core', 'Produtos')
+    Estoque = apps.get_model('core', 'Estoque')
+    soma = (
+        Estoque.objects.filter(produtos=OuterRef('pk'))
+        .order_by().values('produtos')
+        .annotate(total=Sum('quantidade')).values('total')
+    )
+    Produtos.objects.update(estoque_atual=Coalesce(Subquery(soma), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_alter_produtos_preco_venda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtos',
+            name='estoque_atual',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_estoque_atual, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_produtos_estoque_atual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('tipo', models.CharField(max_length=50)),
+                ('chave', models.CharField(blank=True, default='', max_length=100)),
+                ('dados', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=20)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('erro', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'verbose_name': 'Tarefa em Segundo Plano',
+                'verbose_name_plural': 'Tarefas em Segundo Plano',
+                'indexes': [models.Index(fields=['status', 'executar_em'], name='tarefa_status_executar_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pendente'), models.Q(('chave', ''), _negated=True)), fields=('tipo', 'chave'), name='uniq_tarefa_pendente_chave')],
+            },
+        ),
+    ]
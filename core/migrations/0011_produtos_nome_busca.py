@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 09:40
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_busca(texto):
+    # Cópia de core.models.normalizar_busca da época desta migração (migrações não importam o código vivo)
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+
+def preencher_nome_busca(apps, schema_editor):
+    Produtos = apps.get_model('core', 'Produtos')
+    produtos = list(Produtos.objects.only('pk', 'nome_produto', 'codigo'))
+    for produto in produtos:
+        produto.nome_busca = normalizar_busca(f"{produto.nome_produto} {produto.codigo or ''}")
+    Produtos.objects.bulk_update(produtos, ['nome_busca'], batch_size=500)
+
+
+def criar_indice_trigram(apps, schema_editor):
+    # Só o Postgres tem pg_trgm; no SQLite fica o índice comum de nome_busca
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    tabela = apps.get_model('core', 'Produtos')._meta.db_table
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS produtos_nome_busca_trgm ON {tabela} USING gin (nome_busca gin_trgm_ops)'
+    )
+
+
+def remover_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS produtos_nome_busca_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_itemvenda_custo_unitario_ganho_unitario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtos',
+            name='nome_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=110),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice_trigram, remover_indice_trigram),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def preencher_vendas_diarias(apps, schema_editor):
+    Venda = apps.get_model('core', 'Venda')
+    VendaDiaria = apps.get_model('core', 'VendaDiaria')
+    linhas = (
+        Venda.objects.annotate(dia=TruncDate('data'))
+        .values('dia', 'forma_pagamento', 'usuario_id')
+        .annotate(
+            quantidade=Count('pk'),
+            total_bruto=Coalesce(Sum('valor_bruto'), Value(0), output_field=models.DecimalField()),
+            total_liquido=Coalesce(Sum('valor_liquido'), Value(0), output_field=models.DecimalField()),
+        )
+        .order_by()
+    )
+    VendaDiaria.objects.bulk_create([VendaDiaria(**linha) for linha in linhas], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_produtos_nome_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('dia', models.DateField()),
+                ('forma_pagamento', models.CharField(choices=[('pix', 'PIX'), ('cartao_credito', 'Cartão de Crédito'), ('cartao_debito', 'Cartão de Débito'), ('dinheiro', 'Dinheiro'), ('pix_qrcode', 'Pix (QR code)'), ('pendente', 'Pendente')], max_length=20)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('total_bruto', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_liquido', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Venda Diária',
+                'verbose_name_plural': 'Vendas Diárias',
+                'ordering': ['dia'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('usuario__isnull', False)), fields=('dia', 'forma_pagamento', 'usuario'), name='uniq_venda_diaria_usuario'), models.UniqueConstraint(condition=models.Q(('usuario__isnull', True)), fields=('dia', 'forma_pagamento'), name='uniq_venda_diaria_sem_usuario')],
+            },
+        ),
+        migrations.RunPython(preencher_vendas_diarias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_venda_diaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['data'], name='despesa_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoque',
+            index=models.Index(fields=['data_validade'], name='estoque_validade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saidaestoque',
+            index=models.Index(fields=['data_saida'], name='saida_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saidaestoque',
+            index=models.Index(fields=['produto', 'data_saida'], name='saida_produto_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data'], name='venda_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['forma_pagamento', 'data'], name='venda_forma_data_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-17 14:10
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+
+def preencher_dia_e_juntar(apps, schema_editor):
+    SaidaEstoque = apps.get_model('core', 'SaidaEstoque')
+
+    # Dia local de cada saída (sem data_saida, vale a criação; sem nenhuma, hoje)
+    saidas = list(SaidaEstoque.objects.only('pk', 'data_saida', 'criacao'))
+    for saida in saidas:
+        momento = saida.data_saida or saida.criacao
+        saida.dia = timezone.localtime(momento).date() if momento else timezone.localdate()
+    SaidaEstoque.objects.bulk_update(saidas, ['dia'], batch_size=500)
+
+    # Junta as saídas repetidas do mesmo produto e dia na mais antiga
+    repetidas = (
+        SaidaEstoque.objects.filter(produto__isnull=False)
+        .values('produto_id', 'dia')
+        .annotate(linhas=Count('pk'), primeira=Min('pk'), total=Sum('quantidade'))
+        .filter(linhas__gt=1)
+        .order_by()
+    )
+    for grupo in repetidas:
+        SaidaEstoque.objects.filter(pk=grupo['primeira']).update(quantidade=grupo['total'])
+        SaidaEstoque.objects.filter(
+            produto_id=grupo['produto_id'], dia=grupo['dia']
+        ).exclude(pk=grupo['primeira']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_indices_datas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saidaestoque',
+            name='dia',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(preencher_dia_e_juntar, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='saidaestoque',
+            name='dia',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AddConstraint(
+            model_name='saidaestoque',
+            constraint=models.UniqueConstraint(fields=('produto', 'dia'), name='uniq_saida_produto_dia'),
+        ),
+    ]
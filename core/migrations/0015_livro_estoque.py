@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def abrir_livro(apps, schema_editor):
+    # Saldo de abertura: um ajuste por produto com o estoque_atual de hoje
+    Produtos = apps.get_model('core', 'Produtos')
+    MovimentoEstoque = apps.get_model('core', 'MovimentoEstoque')
+    agora = timezone.now()
+    MovimentoEstoque.objects.bulk_create([
+        MovimentoEstoque(produto_id=pk, tipo='ajuste', quantidade=saldo, momento=agora)
+        for pk, saldo in Produtos.objects.exclude(estoque_atual=0).values_list('pk', 'estoque_atual')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_saidaestoque_dia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada'), ('venda', 'Venda'), ('baixa', 'Baixa'), ('ajuste', 'Ajuste')], max_length=10)),
+                ('quantidade', models.IntegerField()),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('produto', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos', to='core.produtos')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Estoque',
+                'verbose_name_plural': 'Movimentos de Estoque',
+                'indexes': [models.Index(fields=['produto', 'momento'], name='movimento_produto_momento_idx'), models.Index(fields=['momento'], name='movimento_momento_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoEstoqueDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('dia', models.DateField()),
+                ('saldo', models.IntegerField()),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_diarios', to='core.produtos')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Estoque do Dia',
+                'verbose_name_plural': 'Saldos de Estoque por Dia',
+                'ordering': ['dia'],
+                'indexes': [models.Index(fields=['dia'], name='saldo_estoque_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('produto', 'dia'), name='uniq_saldo_produto_dia')],
+            },
+        ),
+        migrations.RunPython(abrir_livro, migrations.RunPython.noop),
+    ]
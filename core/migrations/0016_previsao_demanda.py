@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_livro_estoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisaoDemanda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('demanda_semana', models.JSONField(default=list)),
+                ('media_diaria', models.FloatField(default=0)),
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='previsao', to='core.produtos')),
+            ],
+            options={
+                'verbose_name': 'Previsão de Demanda',
+                'verbose_name_plural': 'Previsões de Demanda',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 02:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_previsao_demanda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtos',
+            name='fracao_aberta',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=7),
+        ),
+        migrations.CreateModel(
+            name='ComponenteProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ativo', models.BooleanField(default=True)),
+                ('criacao', models.DateTimeField(auto_now_add=True, null=True)),
+                ('atualizado', models.DateTimeField(auto_now=True, null=True)),
+                ('quantidade', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('componente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='usado_em', to='core.produtos')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='componentes', to='core.produtos')),
+            ],
+            options={
+                'verbose_name': 'Componente do Produto',
+                'verbose_name_plural': 'Componentes do Produto',
+                'constraints': [models.UniqueConstraint(fields=('produto', 'componente'), name='uniq_componente_produto'), models.CheckConstraint(condition=models.Q(('produto', models.F('componente')), _negated=True), name='componente_diferente_produto'), models.CheckConstraint(condition=models.Q(('quantidade__gt', 0)), name='componente_quantidade_positiva')],
+            },
+        ),
+    ]
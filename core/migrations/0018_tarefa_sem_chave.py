@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:04
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_receitas'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='tarefa',
+            name='uniq_tarefa_pendente_chave',
+        ),
+        migrations.RemoveField(
+            model_name='tarefa',
+            name='chave',
+        ),
+    ]
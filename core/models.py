@@ -1,8 +1,17 @@
+import unicodedata
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
-from django.db import transaction
-from django.db.models import Sum, Count, Case, When, IntegerField, Q
+from django.db import transaction, IntegrityError, connection
+from django.db.models import Sum, Count, Case, When, IntegerField, Q, F, Value, OuterRef, Subquery, ExpressionWrapper
+from django.db.models.functions import Coalesce, TruncDate
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .datas import periodo, dias_do_mes
 
 
 class Prime(models.Model):
@@ -31,6 +40,29 @@ class CategoriaProduto(Prime):
         return f'{self.nome_categoria}'
 
 
+def normalizar_busca(texto):
+    """Minúsculas e sem acentos ("Maracujá" -> "maracuja"), para comparar buscas."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+
+class ProdutosQuerySet(models.QuerySet):
+    # bulk_create/bulk_update não passam pelo save(): preenche a coluna de busca aqui
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.atualizar_nome_busca()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if {'nome_produto', 'codigo'} & set(fields):
+            for obj in objs:
+                obj.atualizar_nome_busca()
+            fields = [*fields, 'nome_busca']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class Produtos(Prime):
     codigo = models.CharField(
         max_length=13,
@@ -53,20 +85,124 @@ class Produtos(Prime):
         help_text="Imagem do produto (JPG ou PNG)"
     )
 
+    # Saldo somado de todos os lotes em Estoque, mantido a cada movimentação
+    estoque_atual = models.IntegerField(default=0, editable=False)
+
+    # Fração já servida da garrafa aberta (doses por receita); a garrafa sai do estoque ao ser aberta
+    fracao_aberta = models.DecimalField(max_digits=7, decimal_places=4, default=0, editable=False)
+
+    # Nome + código normalizados (sem acento, minúsculo); é nela que as telas buscam.
+    # No Postgres também tem índice trigram (migração 0011) para buscas "contém".
+    nome_busca = models.CharField(max_length=110, default='', editable=False, db_index=True)
+
+    objects = ProdutosQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Produto'
         verbose_name_plural = 'Produtos'
 
+    def atualizar_nome_busca(self):
+        self.nome_busca = normalizar_busca(f"{self.nome_produto} {self.codigo or ''}")
+
+    @staticmethod
+    def filtro_busca(termo, prefixo=''):
+        """Q para buscar `termo` no nome/código; `prefixo` para filtrar a partir de outro modelo."""
+        return Q(**{f'{prefixo}nome_busca__contains': normalizar_busca(termo)})
+
     def save(self, *args, **kwargs):
         # Calcula ganho_potencial automaticamente
         if self.preco_venda is not None and self.preco_fornecedor is not None:
             self.ganho_potencial = self.preco_venda - self.preco_fornecedor
+
+        self.atualizar_nome_busca()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'nome_produto', 'codigo'} & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'nome_busca']
+
+        # estoque_atual/fracao_aberta só mudam no abatimento; um save() com a instância antiga não os sobrescreve
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ('estoque_atual', 'fracao_aberta')
+            ]
         super().save(*args, **kwargs)
 
+    @classmethod
+    def ajustar_estoque(cls, deltas, tipo='ajuste'):
+        """
+        Soma `deltas` (produto_id -> quantidade, negativa para saídas) em estoque_atual
+        com um único UPDATE atômico e registra a movimentação (`tipo`) no livro de estoque.
+        """
+        deltas = {pid: delta for pid, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        cls.objects.filter(pk__in=deltas.keys()).update(
+            estoque_atual=F('estoque_atual') + Case(
+                *[When(pk=pid, then=Value(delta)) for pid, delta in deltas.items()],
+                output_field=IntegerField(),
+            )
+        )
+        MovimentoEstoque.registrar(deltas, tipo)
+
+    @property
+    def disponivel(self):
+        """Garrafas fechadas mais o que ainda resta da garrafa aberta."""
+        return self.estoque_atual + (1 - self.fracao_aberta if self.fracao_aberta else 0)
+
+    @classmethod
+    def saldo_real(cls):
+        """Subquery com a soma dos lotes em Estoque de cada produto (usada para conferir o saldo)."""
+        soma = (
+            Estoque.objects.filter(produtos=OuterRef('pk'))
+            .order_by().values('produtos')
+            .annotate(total=Sum('quantidade')).values('total')
+        )
+        return Coalesce(Subquery(soma), Value(0))
+
     def __str__(self):
         return f'{self.nome_produto} ({self.codigo})'
 
 
+class ComponenteProduto(Prime):
+    """
+    Receita (ficha técnica) de um produto composto: cada linha diz quanto de um produto
+    de estoque sai a cada unidade vendida. Ex.: Dose de White Horse -> 0,05 da garrafa;
+    combo -> 1 garrafa + 5 gelos + 4 energéticos. Componentes podem ter receita própria.
+    """
+    produto = models.ForeignKey(Produtos, on_delete=models.CASCADE, related_name='componentes')
+    componente = models.ForeignKey(Produtos, on_delete=models.PROTECT, related_name='usado_em')
+    quantidade = models.DecimalField(max_digits=10, decimal_places=4)
+
+    class Meta:
+        verbose_name = "Componente do Produto"
+        verbose_name_plural = "Componentes do Produto"
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'componente'], name='uniq_componente_produto'),
+            models.CheckConstraint(condition=~Q(produto=F('componente')), name='componente_diferente_produto'),
+            models.CheckConstraint(condition=Q(quantidade__gt=0), name='componente_quantidade_positiva'),
+        ]
+
+    def clean(self):
+        """Recusa receita circular: o componente não pode levar (direta ou indiretamente) ao produto."""
+        if not (self.produto_id and self.componente_id):
+            return
+        componentes = defaultdict(set)
+        for produto_id, componente_id in ComponenteProduto.objects.exclude(pk=self.pk).values_list(
+                'produto_id', 'componente_id'):
+            componentes[produto_id].add(componente_id)
+        visitados, pendentes = set(), [self.componente_id]
+        while pendentes:
+            atual = pendentes.pop()
+            if atual == self.produto_id:
+                raise ValidationError({'componente': "Receita circular: este componente já usa o produto."})
+            if atual not in visitados:
+                visitados.add(atual)
+                pendentes.extend(componentes[atual])
+
+    def __str__(self):
+        return f"{self.produto} <- {self.quantidade.normalize()} x {self.componente}"
+
+
 class Estoque(Prime):
     produtos = models.ForeignKey(Produtos, on_delete=models.CASCADE, related_name="produtos")
     data_validade = models.DateField(null=True, blank=True)
@@ -76,6 +212,9 @@ class Estoque(Prime):
     class Meta:
         verbose_name = "Produto em Estoque"
         verbose_name_plural = "Produtos em Estoque"
+        indexes = [
+            models.Index(fields=['data_validade'], name='estoque_validade_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['produtos', 'data_validade'],
@@ -84,9 +223,25 @@ class Estoque(Prime):
             )
         ]
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, tipo=None, **kwargs):
+        """
+        `tipo` é a movimentação registrada no livro; por padrão 'entrada' para lote novo ou
+        quantidade aumentada e 'ajuste' para as demais edições.
+        """
         with transaction.atomic():
-            base_qs = Estoque.objects.select_for_update().filter(produtos=self.produtos)
+            # Trava todos os lotes do produto de uma vez, na mesma ordem (produto, pk) do checkout
+            list(
+                Estoque.objects.select_for_update().filter(produtos=self.produtos)
+                .order_by('produtos_id', 'pk').values_list('pk', flat=True)
+            )
+            base_qs = Estoque.objects.filter(produtos=self.produtos)
+
+            # Produto/quantidade/validade gravados antes desta alteração (saldo e numeração dos lotes)
+            anterior = None
+            if self.pk:
+                anterior = Estoque.objects.filter(pk=self.pk).values(
+                    'produtos_id', 'quantidade', 'data_validade'
+                ).first()
 
             # Fundir com mesmo produto + validade
             same_date = base_qs.filter(data_validade=self.data_validade)
@@ -97,26 +252,57 @@ class Estoque(Prime):
             if existente:
                 existente.quantidade += self.quantidade or 0
                 existente.ativo = existente.quantidade > 0  # atualiza ativo
-                existente.save(update_fields=['quantidade', 'ativo'])
+                existente.save(update_fields=['quantidade', 'ativo'], tipo=tipo)
                 return
 
+            # Atualiza ativo com base na quantidade
+            self.ativo = (self.quantidade or 0) > 0
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'ativo' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'ativo']
             super().save(*args, **kwargs)
 
-            # Atualiza ativo com base na quantidade
-            if self.quantidade <= 0:
-                self.ativo = False
-            else:
-                self.ativo = True
-            super().save(update_fields=['ativo'])
-
-            # Renumera lotes por validade
-            ordenados = base_qs.order_by(
-                Case(When(data_validade__isnull=True, then=1), default=0, output_field=IntegerField()),
-                'data_validade', 'pk'
+            deltas = {}
+            if anterior:
+                deltas[anterior['produtos_id']] = -(anterior['quantidade'] or 0)
+            deltas[self.produtos_id] = deltas.get(self.produtos_id, 0) + (self.quantidade or 0)
+            if tipo is None:
+                mesmo_produto = anterior is None or anterior['produtos_id'] == self.produtos_id
+                tipo = 'entrada' if mesmo_produto and deltas[self.produtos_id] > 0 else 'ajuste'
+            Produtos.ajustar_estoque(deltas, tipo)
+
+            # A ordem dos lotes só depende da validade: renumera (um UPDATE) só se ela mudou
+            if anterior is None or (anterior['produtos_id'], anterior['data_validade']) != (
+                    self.produtos_id, self.data_validade):
+                Estoque.renumerar_lotes({self.produtos_id, *([anterior['produtos_id']] if anterior else [])})
+
+    @classmethod
+    def renumerar_lotes(cls, produto_ids):
+        """
+        Renumera os lotes dos produtos (1 = vence primeiro, sem validade por último) com um
+        único UPDATE por ROW_NUMBER(); só regrava as linhas cujo número mudou.
+        """
+        produto_ids = list(produto_ids)
+        if not produto_ids:
+            return
+        tabela = connection.ops.quote_name(cls._meta.db_table)
+        marcadores = ", ".join(["%s"] * len(produto_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {tabela} AS e SET lote = o.numero
+                FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY produtos_id
+                        ORDER BY CASE WHEN data_validade IS NULL THEN 1 ELSE 0 END, data_validade, id
+                    ) AS numero
+                    FROM {tabela}
+                    WHERE produtos_id IN ({marcadores})
+                ) AS o
+                WHERE e.id = o.id AND (e.lote IS NULL OR e.lote <> o.numero)
+                """,
+                produto_ids,
             )
-            for i, item in enumerate(ordenados, start=1):
-                if item.lote != i:
-                    Estoque.objects.filter(pk=item.pk).update(lote=i)
 
     def __str__(self):
         validade_fmt = self.data_validade.strftime('%d/%m/%Y') if self.data_validade else "Sem validade"
@@ -135,10 +321,19 @@ class SaidaEstoque(Prime):
     codigo_produto = models.CharField(max_length=100, null=True, blank=True)
     quantidade = models.IntegerField()
     data_saida = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    # Dia local da saída: uma linha por produto e dia, somada com upsert (services.registrar_saidas)
+    dia = models.DateField(default=timezone.localdate)
 
     class Meta:
         verbose_name = "Saída de Estoque"
         verbose_name_plural = "Saídas de Estoque"
+        indexes = [
+            models.Index(fields=['data_saida'], name='saida_data_idx'),
+            models.Index(fields=['produto', 'data_saida'], name='saida_produto_data_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'dia'], name='uniq_saida_produto_dia'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -155,6 +350,137 @@ class SaidaEstoque(Prime):
         return f"{self.nome_produto} - {self.quantidade} un. (Saída)"
 
 
+class MovimentoEstoque(Prime):
+    """
+    Livro de movimentações de estoque, só de inclusão: toda variação de saldo
+    (Produtos.ajustar_estoque) vira uma linha com o sinal da quantidade.
+    A soma dos movimentos de um produto é o seu estoque_atual.
+    """
+    TIPOS = [
+        ('entrada', 'Entrada'),
+        ('venda', 'Venda'),
+        ('baixa', 'Baixa'),
+        ('ajuste', 'Ajuste'),
+    ]
+
+    produto = models.ForeignKey(Produtos, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='movimentos')
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    quantidade = models.IntegerField()
+    momento = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Movimento de Estoque"
+        verbose_name_plural = "Movimentos de Estoque"
+        indexes = [
+            models.Index(fields=['produto', 'momento'], name='movimento_produto_momento_idx'),
+            models.Index(fields=['momento'], name='movimento_momento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.quantidade:+d} - {self.produto_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Movimentos de estoque não podem ser alterados; registre um ajuste.")
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def registrar(cls, deltas, tipo, momento=None):
+        """Grava as variações (produto_id -> quantidade) com um único INSERT."""
+        momento = momento or timezone.now()
+        cls.objects.bulk_create([
+            cls(produto_id=pid, tipo=tipo, quantidade=delta, momento=momento)
+            for pid, delta in sorted(deltas.items()) if delta
+        ])
+
+
+class SaldoEstoqueDia(Prime):
+    """
+    Foto do saldo de cada produto no fim do dia, tirada pelo comando fechar_saldos_estoque.
+    O saldo de um produto num dia qualquer é a última foto até ele mais os movimentos depois dela.
+    Produtos sem linha numa foto tinham saldo zero.
+    """
+    produto = models.ForeignKey(Produtos, on_delete=models.CASCADE, related_name='saldos_diarios')
+    dia = models.DateField()
+    saldo = models.IntegerField()
+
+    class Meta:
+        ordering = ['dia']
+        verbose_name = "Saldo de Estoque do Dia"
+        verbose_name_plural = "Saldos de Estoque por Dia"
+        indexes = [
+            models.Index(fields=['dia'], name='saldo_estoque_dia_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'dia'], name='uniq_saldo_produto_dia'),
+        ]
+
+    def __str__(self):
+        return f"{self.produto_id} - {self.dia:%d/%m/%Y}: {self.saldo}"
+
+    @classmethod
+    def saldos_em(cls, dia, produto_ids=None):
+        """
+        Saldo (produto_id -> quantidade) no fim de `dia`: a foto mais recente até o dia
+        mais a soma dos movimentos registrados depois dela (em geral, só os do próprio dia).
+        """
+        ultima = cls.objects.filter(dia__lte=dia).order_by('-dia').values_list('dia', flat=True).first()
+        fotos = cls.objects.filter(dia=ultima)
+        movimentos = MovimentoEstoque.objects.filter(
+            produto__isnull=False,
+            **periodo('momento', ultima + timedelta(days=1) if ultima else None, dia),
+        )
+        if produto_ids is not None:
+            fotos = fotos.filter(produto_id__in=produto_ids)
+            movimentos = movimentos.filter(produto_id__in=produto_ids)
+
+        saldos = defaultdict(int, fotos.values_list('produto_id', 'saldo') if ultima else [])
+        for produto_id, total in (
+            movimentos.order_by().values('produto_id').annotate(total=Sum('quantidade'))
+            .values_list('produto_id', 'total')
+        ):
+            saldos[produto_id] += total
+        return {pid: saldo for pid, saldo in saldos.items() if saldo}
+
+    @classmethod
+    def saldo_em(cls, produto_id, dia):
+        return cls.saldos_em(dia, [produto_id]).get(produto_id, 0)
+
+    @classmethod
+    def fechar(cls, dia):
+        """Grava (ou refaz) a foto de `dia` a partir da foto anterior e dos movimentos do intervalo."""
+        with transaction.atomic():
+            saldos = cls.saldos_em(dia)
+            cls.objects.filter(dia=dia).delete()
+            cls.objects.bulk_create(
+                [cls(produto_id=pid, dia=dia, saldo=saldo) for pid, saldo in sorted(saldos.items())],
+                batch_size=1000,
+            )
+        return len(saldos)
+
+
+class PrevisaoDemanda(Prime):
+    """
+    Demanda prevista de um produto para cada dia da semana (segunda a domingo), recalculada
+    toda noite pelo comando calcular_previsoes (core/previsao.py). A lista de compras lê daqui.
+    """
+    produto = models.OneToOneField(Produtos, on_delete=models.CASCADE, related_name='previsao')
+    demanda_semana = models.JSONField(default=list)
+    media_diaria = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = "Previsão de Demanda"
+        verbose_name_plural = "Previsões de Demanda"
+
+    def __str__(self):
+        return f"{self.produto} - {self.media_diaria:.2f}/dia"
+
+    def demanda_em(self, inicio, dias):
+        """Soma da demanda prevista para `dias` dias a partir de `inicio`."""
+        return sum(self.demanda_semana[(inicio.weekday() + i) % 7] for i in range(dias))
+
+
 from django.utils.timezone import now
 
 
@@ -193,6 +519,10 @@ class Venda(Prime):
     class Meta:
         verbose_name = "Venda"
         verbose_name_plural = "Vendas"
+        indexes = [
+            models.Index(fields=['data'], name='venda_data_idx'),
+            models.Index(fields=['forma_pagamento', 'data'], name='venda_forma_data_idx'),
+        ]
 
     def __str__(self):
         return f"Venda #{self.id} - {self.usuario.username if self.usuario else 'Anônimo'} - R$ {self.valor_liquido or 0:.2f}"
@@ -205,11 +535,37 @@ class ItemVenda(models.Model):
     valor_unitario = models.DecimalField(max_digits=10, decimal_places=2)
     valor_total = models.DecimalField(max_digits=10, decimal_places=2)
     desconto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Custo e ganho por unidade no momento da venda (cópia de preco_fornecedor / ganho_potencial)
+    custo_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    ganho_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "Item de Venda"
         verbose_name_plural = "Itens de Venda"
 
+    def save(self, *args, **kwargs):
+        if self.ganho_unitario is None:
+            self.copiar_custos()
+        super().save(*args, **kwargs)
+
+    def copiar_custos(self):
+        """Guarda no item o custo e o ganho do produto vigentes agora."""
+        self.custo_unitario = self.produto.preco_fornecedor
+        self.ganho_unitario = self.produto.ganho_potencial or 0
+
+    @classmethod
+    def ganho_total(cls):
+        """
+        Expressão do ganho potencial dos itens (ganho_unitario x quantidade) para usar em
+        Sum() por mês, dia ou produto. Itens antigos ainda sem cópia usam o ganho atual do produto.
+        """
+        ganho = Coalesce(F('ganho_unitario'), F('produto__ganho_potencial'), Value(0), output_field=models.DecimalField())
+        return Coalesce(
+            Sum(ExpressionWrapper(ganho * F('quantidade'), output_field=models.DecimalField())),
+            Value(0),
+            output_field=models.DecimalField(),
+        )
+
 
 class CategoriaDespesas(Prime):
     nome = models.CharField(max_length=50, unique=True)
@@ -236,6 +592,9 @@ class Despesa(Prime):
     class Meta:
         verbose_name = "Despesa"
         verbose_name_plural = "Despesas"
+        indexes = [
+            models.Index(fields=['data'], name='despesa_data_idx'),
+        ]
 
     def __str__(self):
         return f"{self.descricao or 'Despesa'} - R$ {self.valor}"
@@ -274,31 +633,172 @@ class FinanceiroMes(Prime):
         return f"{meses[self.mes - 1]} / {self.ano}"
 
     @classmethod
-    def gerar_ou_atualizar(cls, mes=None, ano=None):
+    def calcular(cls, mes, ano):
+        """Recalcula do zero os totais do mês a partir das vendas e despesas (sem gravar)."""
         from core.models import Venda, ItemVenda, Despesa  # evite import circular
 
+        vendas = Venda.objects.filter(**periodo('data', *dias_do_mes(mes, ano)))
+        total_liquido = vendas.aggregate(Sum('valor_liquido'))['valor_liquido__sum'] or 0
+
+        total_ganho_potencial = ItemVenda.objects.filter(venda__in=vendas).aggregate(
+            total=ItemVenda.ganho_total()
+        )['total']
+
+        despesas = Despesa.objects.filter(data__range=dias_do_mes(mes, ano))
+        total_despesas = despesas.aggregate(Sum('valor'))['valor__sum'] or 0
+
+        return {
+            'total_liquido': total_liquido,
+            'total_ganho_potencial': total_ganho_potencial,
+            'total_despesas': total_despesas,
+            'lucro_liquido': total_liquido - total_despesas,
+            'lucro_potencial': total_ganho_potencial - total_despesas,
+        }
+
+    @classmethod
+    def gerar_ou_atualizar(cls, mes=None, ano=None):
+        """
+        Recalcula o mês inteiro. O fechamento é mantido por `aplicar_delta` a cada venda/despesa;
+        isto fica para conferência e reparo (comando recalcular_fechamento e ação do admin).
+        """
         now = datetime.now()
         mes = mes or now.month
         ano = ano or now.year
 
         obj, _ = cls.objects.get_or_create(mes=mes, ano=ano)
+        for campo, valor in cls.calcular(mes, ano).items():
+            setattr(obj, campo, valor)
+        obj.save()
 
-        vendas = Venda.objects.filter(data__year=ano, data__month=mes)
-        total_liquido = vendas.aggregate(Sum('valor_liquido'))['valor_liquido__sum'] or 0
+        return obj
+
+    @classmethod
+    def aplicar_delta(cls, data, liquido=0, ganho=0, despesas=0):
+        """
+        Soma as variações de um evento (venda, quitação, despesa, exclusão) no fechamento
+        do mês de `data`, com um único UPDATE atômico via F().
+        """
+        if data is None or not (liquido or ganho or despesas):
+            return
+        if isinstance(data, datetime):
+            data = timezone.localtime(data) if timezone.is_aware(data) else data
+
+        deltas = {
+            'total_liquido': liquido,
+            'total_ganho_potencial': ganho,
+            'total_despesas': despesas,
+            'lucro_liquido': liquido - despesas,
+            'lucro_potencial': ganho - despesas,
+        }
+        fechamento = cls.objects.filter(mes=data.month, ano=data.year)
+        if fechamento.update(**{campo: F(campo) + valor for campo, valor in deltas.items()}):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(mes=data.month, ano=data.year, **deltas)
+        except IntegrityError:
+            # Outro processo criou o mês ao mesmo tempo
+            fechamento.update(**{campo: F(campo) + valor for campo, valor in deltas.items()})
+
+
+class VendaDiaria(Prime):
+    """
+    Resumo diário das vendas por forma de pagamento e usuário (quantidade e somas),
+    atualizado pelo worker a cada venda/quitação/exclusão. Os gráficos de vendas leem daqui.
+    """
+    dia = models.DateField()
+    forma_pagamento = models.CharField(max_length=20, choices=Venda.FORMAS_PAGAMENTO)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+
+    quantidade = models.IntegerField(default=0)
+    total_bruto = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_liquido = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['dia']
+        verbose_name = "Venda Diária"
+        verbose_name_plural = "Vendas Diárias"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dia', 'forma_pagamento', 'usuario'],
+                name='uniq_venda_diaria_usuario',
+                condition=Q(usuario__isnull=False)
+            ),
+            # Vendas sem usuário: o NULL não entraria na unicidade acima
+            models.UniqueConstraint(
+                fields=['dia', 'forma_pagamento'],
+                name='uniq_venda_diaria_sem_usuario',
+                condition=Q(usuario__isnull=True)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y} - {self.get_forma_pagamento_display()} - {self.quantidade} venda(s)"
 
-        itens = ItemVenda.objects.filter(venda__in=vendas).select_related('produto')
-        total_ganho_potencial = sum(
-            (item.produto.ganho_potencial or 0) * item.quantidade for item in itens
+    @classmethod
+    def calcular(cls):
+        """Totais de todas as vendas agrupados por (dia, forma de pagamento, usuário), sem gravar."""
+        return (
+            Venda.objects.annotate(dia=TruncDate('data'))
+            .values('dia', 'forma_pagamento', 'usuario_id')
+            .annotate(
+                quantidade=Count('pk'),
+                total_bruto=Coalesce(Sum('valor_bruto'), Value(0), output_field=models.DecimalField()),
+                total_liquido=Coalesce(Sum('valor_liquido'), Value(0), output_field=models.DecimalField()),
+            )
+            .order_by('dia')
         )
 
-        despesas = Despesa.objects.filter(data__year=ano, data__month=mes)
-        total_despesas = despesas.aggregate(Sum('valor'))['valor__sum'] or 0
+    @classmethod
+    def recalcular(cls):
+        """Refaz a tabela inteira a partir das vendas (carga inicial e correções)."""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create([cls(**linha) for linha in cls.calcular()], batch_size=1000)
 
-        obj.total_liquido = total_liquido
-        obj.total_ganho_potencial = total_ganho_potencial
-        obj.total_despesas = total_despesas
-        obj.lucro_liquido = total_liquido - total_despesas
-        obj.lucro_potencial = total_ganho_potencial - total_despesas
-        obj.save()
+    @classmethod
+    def aplicar_delta(cls, dia, forma_pagamento, usuario_id, quantidade=0, bruto=0, liquido=0):
+        """Soma as variações de um evento no resumo do dia com um único UPDATE atômico via F()."""
+        if not (quantidade or bruto or liquido):
+            return
+        deltas = {'quantidade': quantidade, 'total_bruto': bruto, 'total_liquido': liquido}
+        linha = cls.objects.filter(dia=dia, forma_pagamento=forma_pagamento, usuario_id=usuario_id)
+        if linha.update(**{campo: F(campo) + valor for campo, valor in deltas.items()}):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(dia=dia, forma_pagamento=forma_pagamento, usuario_id=usuario_id, **deltas)
+        except IntegrityError:
+            # Outro processo criou a linha do dia ao mesmo tempo
+            linha.update(**{campo: F(campo) + valor for campo, valor in deltas.items()})
+
+
+class Tarefa(Prime):
+    """
+    Trabalho adiado para o worker (comando processar_tarefas), gravado na mesma
+    transação do evento que o gerou. Tarefas de tipos `em_lote` vencidas na mesma
+    rodada são executadas juntas (ver tarefas.tarefa).
+    """
+    STATUS = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
 
-        return obj
+    tipo = models.CharField(max_length=50)
+    dados = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS, default='pendente')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    executar_em = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True, default='')
+
+    class Meta:
+        verbose_name = "Tarefa em Segundo Plano"
+        verbose_name_plural = "Tarefas em Segundo Plano"
+        indexes = [
+            models.Index(fields=['status', 'executar_em'], name='tarefa_status_executar_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,138 @@
+"""
+Paginação por chave (keyset/cursor) para listagens grandes.
+
+Em vez de OFFSET + COUNT(*) (cada vez mais caros nas páginas do fim), a próxima página é
+"as linhas depois da última mostrada" na ordem da listagem, então qualquer página custa
+o mesmo que a primeira. O cursor vai na URL como um token assinado (opaco para o usuário).
+A ordem precisa terminar num campo único (ex.: id). Em campos que aceitam nulo, os nulos
+contam como maiores que qualquer valor (o padrão do Postgres): vêm no fim das ordens
+crescentes e no começo das decrescentes.
+"""
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+SAL = "core.paginacao"
+
+
+class PaginaKeyset:
+    def __init__(self, itens, token_anterior, token_proxima, params, parametro):
+        self.object_list = itens
+        self.token_anterior = token_anterior
+        self.token_proxima = token_proxima
+        self._params = params
+        self._parametro = parametro
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_previous(self):
+        return self.token_anterior is not None
+
+    @property
+    def has_next(self):
+        return self.token_proxima is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_previous or self.has_next
+
+    def _url(self, token):
+        params = self._params.copy()
+        params[self._parametro] = token
+        return f"?{params.urlencode()}"
+
+    @property
+    def url_anterior(self):
+        return self._url(self.token_anterior) if self.has_previous else ""
+
+    @property
+    def url_proxima(self):
+        return self._url(self.token_proxima) if self.has_next else ""
+
+
+def _inverter(ordem):
+    return [campo[1:] if campo.startswith("-") else f"-{campo}" for campo in ordem]
+
+
+def _chave(obj, ordem):
+    valores = (getattr(obj, campo.lstrip("-")) for campo in ordem)
+    return [None if valor is None else str(valor) for valor in valores]
+
+
+def _ordenacao(modelo, ordem):
+    """order_by() de `ordem`, com os nulos dos campos anuláveis no lugar fixado acima."""
+    expressoes = []
+    for campo in ordem:
+        nome = campo.lstrip("-")
+        if not modelo._meta.get_field(nome).null:
+            expressoes.append(campo)
+        elif campo.startswith("-"):
+            expressoes.append(F(nome).desc(nulls_first=True))
+        else:
+            expressoes.append(F(nome).asc(nulls_last=True))
+    return expressoes
+
+
+def _depois_de(modelo, ordem, valores):
+    """Q das linhas que vêm depois de `valores` na `ordem` (a, b) > (x, y), campo a campo."""
+    condicao, iguais = Q(), {}
+    for campo, valor in zip(ordem, valores):
+        nome = campo.lstrip("-")
+        decrescente = campo.startswith("-")
+        if valor is None:
+            # Nulo é o maior: numa ordem decrescente vêm depois dele todos os não nulos
+            if decrescente:
+                condicao |= Q(**iguais, **{f"{nome}__isnull": False})
+            iguais[f"{nome}__isnull"] = True
+            continue
+        campo_modelo = modelo._meta.get_field(nome)
+        valor = campo_modelo.to_python(valor)
+        depois = Q(**{f"{nome}__{'lt' if decrescente else 'gt'}": valor})
+        if campo_modelo.null and not decrescente:
+            depois |= Q(**{f"{nome}__isnull": True})
+        condicao |= Q(**iguais) & depois
+        iguais[nome] = valor
+    return condicao
+
+
+def paginar_keyset(queryset, ordem, params, por_pagina, parametro="cursor"):
+    """
+    Página de `queryset` na `ordem` dada (ex.: ["-data", "-id"]), a partir do cursor em
+    `params[parametro]` (request.GET). Sem cursor, ou com cursor inválido, é a primeira página.
+    """
+    direcao, valores, depois = "proxima", None, None
+    token = params.get(parametro)
+    if token:
+        try:
+            direcao, valores = signing.loads(token, salt=SAL)
+            ordem_consulta = _inverter(ordem) if direcao == "anterior" else list(ordem)
+            depois = _depois_de(queryset.model, ordem_consulta, valores)
+        except (signing.BadSignature, ValidationError, ValueError, TypeError):
+            direcao, valores, depois = "proxima", None, None
+
+    voltando = direcao == "anterior"
+    ordem_consulta = _inverter(ordem) if voltando else list(ordem)
+    qs = queryset.order_by(*_ordenacao(queryset.model, ordem_consulta))
+    if depois is not None:
+        qs = qs.filter(depois)
+
+    itens = list(qs[:por_pagina + 1])
+    tem_mais = len(itens) > por_pagina
+    itens = itens[:por_pagina]
+    if voltando:
+        itens.reverse()
+        tem_anterior, tem_proxima = tem_mais, True
+    else:
+        tem_anterior, tem_proxima = valores is not None, tem_mais
+
+    token_anterior = token_proxima = None
+    if itens and tem_anterior:
+        token_anterior = signing.dumps(["anterior", _chave(itens[0], ordem)], salt=SAL)
+    if itens and tem_proxima:
+        token_proxima = signing.dumps(["proxima", _chave(itens[-1], ordem)], salt=SAL)
+    return PaginaKeyset(itens, token_anterior, token_proxima, params, parametro)
@@ -0,0 +1,90 @@
+"""
+Previsão de demanda para a lista de compras.
+
+A demanda diária de cada produto sai das Saídas de Estoque (uma linha por produto e dia,
+com vendas, complementos de doses/combos e baixas), ou seja, do que realmente saiu das
+prateleiras. Com ela monta-se uma matriz produtos × dias e ajusta-se, para todos os
+produtos de uma vez, uma suavização exponencial com sazonalidade por dia da semana
+(Holt-Winters aditivo, sem tendência).
+
+O comando calcular_previsoes roda toda noite e grava o resultado em PrevisaoDemanda;
+a tela lista_compras só lê essa tabela.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PrevisaoDemanda, SaidaEstoque
+
+HISTORICO_DIAS = 56  # oito semanas completas
+ALFA = 0.3  # peso do dia mais recente no nível
+GAMA = 0.2  # peso da semana mais recente no efeito de cada dia da semana
+
+
+def matriz_demanda(inicio, fim):
+    """
+    Demanda diária de `inicio` a `fim` (inclusive): devolve (produto_ids, matriz) com
+    uma linha por produto e uma coluna por dia; dias sem saída ficam com zero.
+    """
+    linhas = list(
+        SaidaEstoque.objects.filter(produto__isnull=False, dia__range=(inicio, fim))
+        .values_list("produto_id", "dia", "quantidade")
+    )
+    produto_ids = sorted({produto_id for produto_id, _dia, _qtd in linhas})
+    matriz = np.zeros((len(produto_ids), (fim - inicio).days + 1))
+    if linhas:
+        indice = {produto_id: i for i, produto_id in enumerate(produto_ids)}
+        posicoes = np.array([(indice[pid], (dia - inicio).days) for pid, dia, _qtd in linhas])
+        np.add.at(matriz, (posicoes[:, 0], posicoes[:, 1]), [qtd for _pid, _dia, qtd in linhas])
+    return produto_ids, matriz
+
+
+def ajustar(matriz, inicio, alfa=ALFA, gama=GAMA):
+    """
+    Ajusta o modelo em todas as linhas da matriz de uma vez. Devolve o nível final (P,)
+    e o efeito de cada dia da semana (P, 7), indexado por date.weekday().
+    """
+    produtos, dias = matriz.shape
+    dia_semana = (inicio.weekday() + np.arange(dias)) % 7
+
+    # Partida: média das duas primeiras semanas e desvio médio de cada dia da semana nelas
+    partida = matriz[:, :14]
+    nivel = partida.mean(axis=1)
+    sazonal = np.zeros((produtos, 7))
+    for dia in range(7):
+        colunas = dia_semana[:partida.shape[1]] == dia
+        if colunas.any():
+            sazonal[:, dia] = partida[:, colunas].mean(axis=1) - nivel
+
+    for t in range(dias):
+        dia = dia_semana[t]
+        demanda = matriz[:, t]
+        nivel = alfa * (demanda - sazonal[:, dia]) + (1 - alfa) * nivel
+        sazonal[:, dia] = gama * (demanda - nivel) + (1 - gama) * sazonal[:, dia]
+    return nivel, sazonal
+
+
+def calcular(hoje=None, historico=HISTORICO_DIAS):
+    """Demanda prevista por dia da semana (produto_id -> 7 valores) com base nos dias já fechados."""
+    fim = (hoje or timezone.localdate()) - timedelta(days=1)
+    inicio = fim - timedelta(days=historico - 1)
+    produto_ids, matriz = matriz_demanda(inicio, fim)
+    if not produto_ids:
+        return {}
+    nivel, sazonal = ajustar(matriz, inicio)
+    semana = np.maximum(nivel[:, None] + sazonal, 0)
+    return dict(zip(produto_ids, semana.round(3).tolist()))
+
+
+def gravar_previsoes(hoje=None):
+    """Refaz a tabela PrevisaoDemanda; devolve quantos produtos têm previsão."""
+    previsoes = [
+        PrevisaoDemanda(produto_id=produto_id, demanda_semana=semana, media_diaria=round(sum(semana) / 7, 3))
+        for produto_id, semana in calcular(hoje).items() if any(semana)
+    ]
+    with transaction.atomic():
+        PrevisaoDemanda.objects.all().delete()
+        PrevisaoDemanda.objects.bulk_create(previsoes, batch_size=1000)
+    return len(previsoes)
@@ -0,0 +1,675 @@
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+
+from django.db import connection, transaction, OperationalError
+from django.db.models import F, Q, Sum, Case, When, Value, DecimalField, IntegerField, Window
+from django.db.models.functions import Least, Greatest
+from django.utils import timezone
+
+from . import catalogo
+from .models import Produtos, Estoque, SaidaEstoque, Venda, ItemVenda, FinanceiroMes, VendaDiaria
+from .tarefas import tarefa, enfileirar
+
+# Erros do Postgres (serialização / deadlock) e do SQLite que valem nova tentativa
+CODIGOS_CONCORRENCIA = ("40001", "40P01")
+MENSAGENS_CONCORRENCIA = ("database is locked", "database table is locked")
+
+# Lotes por UPDATE na baixa geral (mantém o número de parâmetros abaixo do limite do SQLite)
+LOTE_BAIXA = 200
+
+
+def _numero(quantidade):
+    # 5, 0.05 e 6.0000 (Decimal das receitas) -> "5", "0.05" e "6"
+    return f"{Decimal(quantidade).normalize():f}"
+
+
+class EstoqueInsuficiente(ValueError):
+    """
+    Levantada quando o carrinho pede mais do que existe em estoque.
+    `faltas` guarda (produto, disponível, necessário) para cada produto.
+    """
+
+    def __init__(self, faltas):
+        self.faltas = faltas
+        detalhes = ", ".join(
+            f"{produto.nome_produto} (Disponível: {_numero(disponivel)}, Necessário: {_numero(necessario)})"
+            for produto, disponivel, necessario in faltas
+        )
+        super().__init__("Estoque insuficiente: " + detalhes)
+
+
+def _erro_de_concorrencia(erro):
+    causa = erro.__cause__
+    if getattr(causa, "pgcode", None) in CODIGOS_CONCORRENCIA:
+        return True
+    return any(msg in str(erro) for msg in MENSAGENS_CONCORRENCIA)
+
+
+def com_retentativas(tentativas=4, espera=0.05):
+    """
+    Repete a transação decorada quando o banco a aborta por conflito de concorrência
+    (falha de serialização, deadlock ou banco travado), com espera exponencial aleatória.
+    Só repete quando a função é a transação mais externa; dentro de outro atomic, o erro sobe.
+    """
+    def decorador(func):
+        @wraps(func)
+        def executar(*args, **kwargs):
+            for tentativa in range(1, tentativas + 1):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as erro:
+                    if (tentativa == tentativas or not _erro_de_concorrencia(erro)
+                            or transaction.get_connection().in_atomic_block):
+                        raise
+                    time.sleep(random.uniform(0, espera * 2 ** tentativa))
+        return executar
+    return decorador
+
+
+def travar_lotes(produto_ids):
+    """
+    Trava todos os lotes dos produtos numa única consulta, sempre na mesma ordem global
+    (produto, pk). Como todo caminho que escreve em Estoque trava nessa ordem, dois
+    carrinhos com os mesmos produtos em ordens diferentes esperam um pelo outro
+    em vez de entrar em deadlock.
+    """
+    return list(
+        Estoque.objects.select_for_update()
+        .filter(produtos_id__in=produto_ids)
+        .order_by("produtos_id", "pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def _quantidade_complemento(comp, categoria, com_receita):
+    qtd = int(comp.get("qtd", 0))
+    # 🔥 Combo sem receita cadastrada e sem quantidade definida: o gelo usa padrão de 5
+    if not qtd and not com_receita and categoria == "combos" and comp["tipo"] == "gelo":
+        return 5
+    return qtd
+
+
+def montar_carrinho(carrinho):
+    """
+    Carrega numa única consulta todos os produtos do carrinho (itens, complementos e os
+    produtos de estoque das receitas, já com a categoria) e devolve as linhas resolvidas
+    e a demanda de estoque por produto.
+
+    Cada item é expandido pela tabela de receitas em cache (catalogo.receitas, lida uma vez por carrinho):
+    doses e combos viram as frações de garrafa, gelos etc. que consomem.
+    Cada linha é um dict com `produto`, `qtd`, `preco` e `complementos`
+    (lista de tuplas (tipo, produto, qtd)).
+    """
+    ids = set()
+    for item in carrinho:
+        ids.add(int(item["id"]))
+        ids.update(int(comp["id"]) for comp in item.get("complementos", []))
+    tabela = catalogo.receitas()
+    componentes = {pid for produto_id in ids for pid in tabela.get(produto_id) or {}}
+
+    produtos = Produtos.objects.select_related("categoria").in_bulk(ids | componentes)
+    faltando = sorted(ids - produtos.keys())
+    if faltando:
+        raise ValueError(f"Produto não encontrado: {', '.join(map(str, faltando))}")
+
+    linhas = []
+    demanda = defaultdict(int)
+    for item in carrinho:
+        produto = produtos[int(item["id"])]
+        categoria = (produto.categoria.nome_categoria or "").lower()
+        qtd = int(item.get("qtd", 0))
+        com_receita = produto.id in tabela
+
+        # Produto de estoque abate a si mesmo; dose/combo, os componentes da receita
+        expansao = catalogo.expansao_estoque(produto, tabela)
+        for base_id, quantidade in expansao.items():
+            demanda[base_id] += quantidade * qtd
+
+        complementos = []
+        for comp in item.get("complementos", []):
+            produto_comp = produtos[int(comp["id"])]
+            qtd_comp = _quantidade_complemento(comp, categoria, com_receita)
+            complementos.append((comp["tipo"], produto_comp, qtd_comp))
+
+            # Apenas gelo e Red Bull saem do estoque; o que a receita já abate não sai de novo
+            if comp["tipo"] in ("gelo", "rb") and produto_comp.id not in expansao:
+                demanda[produto_comp.id] += qtd_comp
+
+        linhas.append({
+            "produto": produto,
+            "qtd": qtd,
+            "preco": Decimal(str(item["preco"])),
+            "complementos": complementos,
+        })
+
+    return linhas, dict(demanda), produtos
+
+
+def verificar_disponibilidade(demanda, produtos):
+    """
+    Confere a demanda contra o saldo materializado (Produtos.estoque_atual) dos produtos
+    já carregados, sem consultar os lotes. Serve para recusar cedo, antes de travar
+    qualquer linha; a conferência definitiva é feita em `abater_estoque_em_lote`.
+    """
+    faltas = [
+        (produtos[pid], produtos[pid].disponivel, qtd)
+        for pid, qtd in demanda.items()
+        if qtd > 0 and produtos[pid].disponivel < qtd
+    ]
+    if faltas:
+        raise EstoqueInsuficiente(faltas)
+
+
+def consumo_por_lote(demanda):
+    """
+    Calcula numa única consulta quanto abater de cada lote (FIFO por lote/validade)
+    para atender `demanda` (produto_id -> quantidade).
+
+    Usa uma soma acumulada por produto: cada lote consome
+    min(quantidade, demanda - acumulado_antes_dele). Retorna tuplas
+    (pk, produto_id, quantidade, abate, disponível_do_produto) só dos lotes consumidos.
+    """
+    ordem_fifo = [F("lote").asc(nulls_last=True), F("data_validade").asc(nulls_last=True), F("pk").asc()]
+    demanda_produto = Case(
+        *[When(produtos_id=pid, then=Value(qtd)) for pid, qtd in demanda.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return (
+        Estoque.objects
+        .filter(produtos_id__in=demanda.keys(), quantidade__gt=0)
+        .annotate(
+            acumulado=Window(Sum("quantidade"), partition_by=[F("produtos_id")], order_by=ordem_fifo),
+            disponivel=Window(Sum("quantidade"), partition_by=[F("produtos_id")]),
+        )
+        .annotate(
+            abate=Least(
+                F("quantidade"),
+                Greatest(demanda_produto - (F("acumulado") - F("quantidade")), Value(0)),
+            )
+        )
+        .filter(abate__gt=0)
+        .values_list("pk", "produtos_id", "quantidade", "abate", "disponivel")
+    )
+
+
+def _abrir_garrafas(demanda):
+    """
+    Converte a demanda fracionada das receitas (ex.: 0,05 garrafa por dose) em garrafas
+    inteiras: soma na garrafa aberta de cada produto (Produtos.fracao_aberta) e só abate
+    as garrafas que precisarem ser abertas. Chamada com os lotes já travados; trava os
+    produtos fracionados em seguida, na ordem (pk), como o resto do checkout.
+    """
+    fracionados = sorted(pid for pid, qtd in demanda.items() if qtd != int(qtd))
+    inteiras = {pid: int(qtd) for pid, qtd in demanda.items() if pid not in fracionados}
+    if fracionados:
+        abertas = dict(
+            Produtos.objects.select_for_update().filter(pk__in=fracionados)
+            .order_by("pk").values_list("pk", "fracao_aberta")
+        )
+        novas = {}
+        for pid in fracionados:
+            total = abertas[pid] + Decimal(demanda[pid])
+            inteiras[pid] = math.ceil(total) - math.ceil(abertas[pid])
+            novas[pid] = total - math.floor(total)
+        Produtos.objects.filter(pk__in=novas.keys()).update(
+            fracao_aberta=Case(
+                *[When(pk=pid, then=Value(fracao)) for pid, fracao in novas.items()],
+                output_field=DecimalField(max_digits=7, decimal_places=4),
+            )
+        )
+    return {pid: qtd for pid, qtd in inteiras.items() if qtd > 0}
+
+
+def abater_estoque_em_lote(demanda, produtos=None, exigir_total=True, tipo="venda"):
+    """
+    Abate o estoque de vários produtos de uma vez, consumindo primeiro os lotes mais antigos.
+
+    `demanda` mapeia produto_id -> quantidade (fracionada nas doses por receita).
+    Com `exigir_total`, nada é gravado e `EstoqueInsuficiente` é levantada se algum produto
+    não tiver o suficiente; sem ele, abate o que houver. `tipo` é o do movimento no livro
+    de estoque. Retorna produto_id -> total abatido (garrafas inteiras).
+
+    O registro das saídas do dia e a remoção dos lotes zerados ficam para o worker.
+    """
+    demanda = {pid: qtd for pid, qtd in demanda.items() if qtd > 0}
+    if not demanda:
+        return {}
+
+    with transaction.atomic():
+        # Trava os lotes antes do cálculo (o Postgres não aceita FOR UPDATE junto com window)
+        travar_lotes(demanda.keys())
+        demanda = _abrir_garrafas(demanda)
+
+        consumo = {}
+        disponivel = defaultdict(int)
+        for pk, produto_id, quantidade, abate, total in consumo_por_lote(demanda):
+            consumo[pk] = (produto_id, quantidade, abate)
+            disponivel[produto_id] = total
+
+        if exigir_total:
+            faltas = [pid for pid, qtd in demanda.items() if disponivel[pid] < qtd]
+            if faltas:
+                if produtos is None:
+                    produtos = Produtos.objects.in_bulk(faltas)
+                raise EstoqueInsuficiente([
+                    (produtos[pid], disponivel[pid], demanda[pid]) for pid in faltas
+                ])
+
+        abatido = defaultdict(int)
+        for pk, (produto_id, quantidade, abate) in consumo.items():
+            abatido[produto_id] += abate
+
+        # Um único UPDATE para todos os lotes; os que zeram são apagados depois pelo worker
+        if consumo:
+            Estoque.objects.filter(pk__in=consumo.keys()).update(
+                quantidade=F("quantidade") - Case(
+                    *[When(pk=pk, then=Value(abate)) for pk, (_p, _q, abate) in consumo.items()],
+                    output_field=IntegerField(),
+                )
+            )
+
+        Produtos.ajustar_estoque({pid: -qtd for pid, qtd in abatido.items()}, tipo)
+        catalogo.invalidar("estoque")  # o UPDATE em lote não dispara os sinais de Estoque
+
+        if abatido:
+            enfileirar("registrar_saidas", {
+                "momento": timezone.now().isoformat(),
+                "quantidades": {str(pid): qtd for pid, qtd in abatido.items()},
+            })
+        zerados = sorted({pid for pid, quantidade, abate in consumo.values() if abate >= quantidade})
+        if zerados:
+            # 🔥 Remove os lotes zerados dos produtos desta venda (o worker junta as vendas do mesmo segundo)
+            enfileirar("limpar_estoque_zerado", {"produtos": zerados}, atraso=1)
+
+    return dict(abatido)
+
+
+def registrar_saidas(quantidades, produtos=None, momento=None):
+    """
+    Soma as quantidades (produto_id -> qtd) na Saída de Estoque do dia de cada produto com um
+    único INSERT ... ON CONFLICT (produto, dia): cria a linha do dia ou incrementa a existente
+    no próprio banco, sem ler antes. `momento` é quando a saída aconteceu (padrão: agora).
+    Retorna produto_id -> id da Saída de Estoque do dia.
+    """
+    quantidades = {pid: qtd for pid, qtd in quantidades.items() if qtd > 0}
+    if not quantidades:
+        return {}
+
+    if produtos is None or not quantidades.keys() <= produtos.keys():
+        produtos = Produtos.objects.in_bulk(quantidades.keys())
+
+    momento = momento or timezone.now()
+    ops = connection.ops
+    tabela = ops.quote_name(SaidaEstoque._meta.db_table)
+    dia = ops.adapt_datefield_value(timezone.localtime(momento).date())
+    momento = ops.adapt_datetimefield_value(momento)
+    agora = ops.adapt_datetimefield_value(timezone.now())
+    valores, params = [], []
+    for pid, qtd in sorted(quantidades.items()):
+        produto = produtos[pid]
+        valores.append("(%s, %s, %s, %s, %s, %s, %s, %s, %s)")
+        params += [pid, produto.nome_produto, produto.codigo, qtd, momento, dia, True, agora, agora]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (produto_id, nome_produto, codigo_produto, quantidade, data_saida, dia,
+                                  ativo, criacao, atualizado)
+            VALUES {", ".join(valores)}
+            ON CONFLICT (produto_id, dia)
+            DO UPDATE SET quantidade = {tabela}.quantidade + EXCLUDED.quantidade,
+                          atualizado = EXCLUDED.atualizado
+            RETURNING produto_id, id
+            """,
+            params,
+        )
+        return dict(cursor.fetchall())
+
+
+def criar_itens_venda(venda, linhas, valor_bruto, desconto_total):
+    """
+    Cria com um único INSERT os itens da venda (itens principais e complementos).
+    O desconto total é rateado proporcionalmente entre os itens principais.
+    """
+    itens = []
+    for linha in linhas:
+        valor_item_bruto = linha["preco"] * linha["qtd"]
+        desconto_item = round((valor_item_bruto / valor_bruto) * desconto_total, 2) if valor_bruto > 0 else 0
+        valor_item_liquido = max(valor_item_bruto - desconto_item, 0)
+
+        # Item principal
+        itens.append(ItemVenda(
+            venda=venda,
+            produto=linha["produto"],
+            quantidade=linha["qtd"],
+            valor_unitario=linha["preco"],
+            valor_total=valor_item_liquido,
+            desconto=desconto_item,
+        ))
+
+        # 🧾 Complementos: gelo + Red Bull
+        for _tipo, produto_comp, qtd_comp in linha["complementos"]:
+            itens.append(ItemVenda(
+                venda=venda,
+                produto=produto_comp,
+                quantidade=qtd_comp,
+                valor_unitario=produto_comp.preco_venda,
+                valor_total=produto_comp.preco_venda * qtd_comp,
+                desconto=0,
+            ))
+
+    # Custo e margem do momento da venda (bulk_create não chama save())
+    for item in itens:
+        item.copiar_custos()
+
+    itens = ItemVenda.objects.bulk_create(itens)
+
+    # bulk_create não dispara sinais: soma o ganho dos itens no fechamento do mês aqui
+    adiar_fechamento(venda.data, ganho=sum(item.ganho_unitario * item.quantidade for item in itens))
+    return itens
+
+
+@com_retentativas()
+def registrar_venda(linhas, demanda, produtos, valor_bruto, desconto_total, **dados_venda):
+    """
+    Grava a venda numa única transação: abate o estoque do carrinho inteiro,
+    cria a Venda e os itens. Repetida automaticamente em caso de conflito de concorrência.
+    """
+    with transaction.atomic():
+        # 1️⃣ Valida e abate o estoque do carrinho inteiro
+        abater_estoque_em_lote(demanda, produtos)
+
+        # 2️⃣ Cria venda
+        venda = Venda.objects.create(valor_bruto=valor_bruto, desconto_total=desconto_total, **dados_venda)
+
+        # 3️⃣ Cria itens da venda
+        criar_itens_venda(venda, linhas, valor_bruto, desconto_total)
+
+    return venda
+
+
+def _validar_entradas(itens):
+    """Confere todos os itens antes de gravar; devolve {(produto_id, validade): quantidade}."""
+    entradas, erros = defaultdict(int), []
+    for n, item in enumerate(itens, start=1):
+        try:
+            produto_id = int(item["id"])
+            quantidade = int(item["quantidade"])
+            validade = item.get("validade") or None
+            if validade:
+                validade = datetime.strptime(validade, "%Y-%m-%d").date()
+        except (KeyError, TypeError, ValueError):
+            erros.append(f"Item {n}: dados inválidos")
+            continue
+        if quantidade <= 0:
+            erros.append(f"Item {n}: quantidade deve ser maior que zero")
+            continue
+        entradas[(produto_id, validade)] += quantidade
+
+    ids = {produto_id for produto_id, _ in entradas}
+    faltando = sorted(ids - set(Produtos.objects.filter(pk__in=ids).values_list("pk", flat=True)))
+    if faltando:
+        erros.append(f"Produto(s) não encontrado(s): {', '.join(map(str, faltando))}")
+    if erros:
+        raise ValueError("; ".join(erros))
+    return entradas
+
+
+def _upsert_com_validade(entradas):
+    """
+    Um INSERT ... ON CONFLICT para os lotes com validade: soma na linha existente do mesmo
+    (produto, validade), usando a restrição única parcial uniq_produto_validade_not_null.
+    """
+    if not entradas:
+        return
+    ops = connection.ops
+    tabela = ops.quote_name(Estoque._meta.db_table)
+    agora = ops.adapt_datetimefield_value(timezone.now())
+    valores, params = [], []
+    for (produto_id, validade), quantidade in entradas.items():
+        valores.append("(%s, %s, %s, %s, %s, %s)")
+        params += [produto_id, ops.adapt_datefield_value(validade), quantidade, True, agora, agora]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (produtos_id, data_validade, quantidade, ativo, criacao, atualizado)
+            VALUES {", ".join(valores)}
+            ON CONFLICT (produtos_id, data_validade) WHERE data_validade IS NOT NULL
+            DO UPDATE SET quantidade = {tabela}.quantidade + EXCLUDED.quantidade,
+                          ativo = {tabela}.quantidade + EXCLUDED.quantidade > 0,
+                          atualizado = EXCLUDED.atualizado
+            """,
+            params,
+        )
+
+
+def _somar_sem_validade(entradas):
+    """Lotes sem validade não entram na restrição única: soma no primeiro existente ou cria."""
+    if not entradas:
+        return
+    existentes = {}
+    for pk, produto_id in (
+        Estoque.objects.filter(produtos_id__in=entradas.keys(), data_validade__isnull=True)
+        .order_by("produtos_id", "pk").values_list("pk", "produtos_id")
+    ):
+        existentes.setdefault(produto_id, pk)
+
+    if existentes:
+        Estoque.objects.filter(pk__in=existentes.values()).update(
+            quantidade=F("quantidade") + Case(
+                *[When(pk=pk, then=Value(entradas[pid])) for pid, pk in existentes.items()],
+                output_field=IntegerField(),
+            ),
+            ativo=True,
+        )
+    Estoque.objects.bulk_create([
+        Estoque(produtos_id=pid, quantidade=qtd) for pid, qtd in entradas.items() if pid not in existentes
+    ])
+
+
+@com_retentativas()
+def receber_estoque(itens):
+    """
+    Entrada de mercadoria em massa (estoque_adicao_massa): valida todos os itens numa passada,
+    junta por (produto, validade), grava com um upsert e renumera os lotes uma vez por produto,
+    tudo numa transação só. Levanta ValueError (sem gravar nada) se algum item for inválido.
+    """
+    entradas = _validar_entradas(itens)
+    com_validade = {chave: qtd for chave, qtd in entradas.items() if chave[1] is not None}
+    sem_validade = {pid: qtd for (pid, validade), qtd in entradas.items() if validade is None}
+
+    totais = defaultdict(int)
+    for (produto_id, _), quantidade in entradas.items():
+        totais[produto_id] += quantidade
+
+    with transaction.atomic():
+        travar_lotes(sorted(totais))
+        _upsert_com_validade(com_validade)
+        _somar_sem_validade(sem_validade)
+        Produtos.ajustar_estoque(totais, "entrada")
+        Estoque.renumerar_lotes(sorted(totais))
+        catalogo.invalidar("estoque")  # upsert/bulk_create não disparam os sinais de Estoque
+    return dict(totais)
+
+
+def _validar_baixas(itens):
+    """Confere os itens da baixa geral; devolve {estoque_id: quantidade} (itens com 0 são ignorados)."""
+    baixas, erros = defaultdict(int), []
+    for n, item in enumerate(itens, start=1):
+        try:
+            estoque_id = int(item["id"])
+            quantidade = int(item.get("qtd_remover") or 0)
+        except (KeyError, TypeError, ValueError):
+            erros.append(f"Item {n}: dados inválidos")
+            continue
+        if quantidade < 0:
+            erros.append(f"Item {n}: quantidade não pode ser negativa")
+        elif quantidade:
+            baixas[estoque_id] += quantidade
+    if erros:
+        raise ValueError("; ".join(erros))
+    return baixas
+
+
+def _abater_lotes(baixas, lote=LOTE_BAIXA):
+    """
+    Abate {estoque_id: quantidade} com um UPDATE protegido por lote de ids: cada linha só
+    é alterada se ainda tiver `quantidade >= n`. Levanta ValueError com os lotes que não
+    tinham o suficiente (a transação de fora desfaz tudo).
+    """
+    ids = sorted(baixas)
+    for inicio in range(0, len(ids), lote):
+        parte = ids[inicio:inicio + lote]
+        guarda = Q()
+        for pk in parte:
+            guarda |= Q(pk=pk, quantidade__gte=baixas[pk])
+        with transaction.atomic():
+            alterados = Estoque.objects.filter(guarda).update(
+                quantidade=F("quantidade") - Case(
+                    *[When(pk=pk, then=Value(baixas[pk])) for pk in parte],
+                    output_field=IntegerField(),
+                ),
+                atualizado=timezone.now(),
+            )
+            # Desfaz só este lote (savepoint) para apontar as faltas pelos saldos de antes
+            if alterados != len(parte):
+                transaction.set_rollback(True)
+        if alterados != len(parte):
+            faltas = Estoque.objects.filter(pk__in=parte).values_list(
+                "pk", "lote", "produtos__nome_produto", "quantidade"
+            )
+            raise ValueError("Quantidade insuficiente: " + ", ".join(
+                f"{nome} lote {numero} (Disponível: {quantidade}, Necessário: {baixas[pk]})"
+                for pk, numero, nome, quantidade in faltas if quantidade < baixas[pk]
+            ))
+
+
+@com_retentativas()
+def baixar_estoque(itens):
+    """
+    Baixa geral da tela de estoque: abate vários lotes de uma vez (`itens` com id do lote e
+    qtd_remover), apaga os que zeraram, atualiza o saldo dos produtos e soma as Saídas de
+    Estoque do dia, tudo numa transação só. Levanta ValueError (sem gravar nada) se algum
+    item for inválido ou pedir mais do que o lote tem. Retorna produto_id -> id da Saída
+    de Estoque do dia em que a baixa foi somada.
+    """
+    baixas = _validar_baixas(itens)
+    if not baixas:
+        return {}
+
+    with transaction.atomic():
+        produto_de = dict(Estoque.objects.filter(pk__in=baixas.keys()).values_list("pk", "produtos_id"))
+        faltando = sorted(baixas.keys() - produto_de.keys())
+        if faltando:
+            raise ValueError(f"Lote(s) não encontrado(s): {', '.join(map(str, faltando))}")
+
+        travar_lotes(sorted(set(produto_de.values())))
+        # Com a trava, o UPDATE protegido de cada lote é a última palavra sobre o saldo
+        _abater_lotes(baixas)
+        Estoque.objects.filter(pk__in=baixas.keys(), quantidade__lte=0).delete()
+
+        totais = defaultdict(int)
+        for pk, quantidade in baixas.items():
+            totais[produto_de[pk]] += quantidade
+        Produtos.ajustar_estoque({pid: -qtd for pid, qtd in totais.items()}, "baixa")
+        Estoque.renumerar_lotes(sorted(totais))
+        saidas = registrar_saidas(totais)
+        catalogo.invalidar("estoque")  # o UPDATE em lote não dispara os sinais de Estoque
+    return saidas
+
+
+def adiar_fechamento(data, liquido=0, ganho=0, despesas=0):
+    """
+    Enfileira a variação do fechamento mensal (FinanceiroMes) do mês de `data`.
+    O worker soma as variações pendentes e grava uma atualização por mês.
+    """
+    if data is None or not (liquido or ganho or despesas):
+        return
+    if isinstance(data, datetime) and timezone.is_aware(data):
+        data = timezone.localtime(data)
+    enfileirar("fechamento", {
+        "ano": data.year,
+        "mes": data.month,
+        "liquido": str(liquido),
+        "ganho": str(ganho),
+        "despesas": str(despesas),
+    })
+
+
+def adiar_venda_diaria(data, forma_pagamento, usuario_id, quantidade=0, bruto=0, liquido=0):
+    """
+    Enfileira a variação do resumo diário (VendaDiaria) do dia de `data`, forma de pagamento
+    e usuário. O worker junta as variações pendentes por chave.
+    """
+    if data is None or not (quantidade or bruto or liquido):
+        return
+    if isinstance(data, datetime) and timezone.is_aware(data):
+        data = timezone.localtime(data)
+    enfileirar("venda_diaria", {
+        "dia": data.strftime("%Y-%m-%d"),
+        "forma_pagamento": forma_pagamento,
+        "usuario_id": usuario_id,
+        "quantidade": quantidade,
+        "bruto": str(bruto),
+        "liquido": str(liquido),
+    })
+
+
+# ==========================
+# TAREFAS DO WORKER
+# ==========================
+@tarefa("fechamento", em_lote=True)
+def aplicar_fechamentos(lista):
+    por_mes = defaultdict(lambda: defaultdict(Decimal))
+    for dados in lista:
+        totais = por_mes[(dados["ano"], dados["mes"])]
+        for campo in ("liquido", "ganho", "despesas"):
+            totais[campo] += Decimal(dados[campo])
+
+    for (ano, mes), totais in sorted(por_mes.items()):
+        FinanceiroMes.aplicar_delta(date(ano, mes, 1), **totais)
+
+
+@tarefa("venda_diaria", em_lote=True)
+def aplicar_vendas_diarias(lista):
+    por_chave = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for dados in lista:
+        totais = por_chave[(dados["dia"], dados["forma_pagamento"], dados["usuario_id"])]
+        totais[0] += dados["quantidade"]
+        totais[1] += Decimal(dados["bruto"])
+        totais[2] += Decimal(dados["liquido"])
+
+    for (dia, forma_pagamento, usuario_id), (quantidade, bruto, liquido) in sorted(
+        por_chave.items(), key=lambda item: (item[0][0], item[0][1], item[0][2] or 0)
+    ):
+        VendaDiaria.aplicar_delta(date.fromisoformat(dia), forma_pagamento, usuario_id,
+                                  quantidade=quantidade, bruto=bruto, liquido=liquido)
+
+
+@tarefa("registrar_saidas", em_lote=True)
+def aplicar_saidas(lista):
+    # Junta as saídas de todas as vendas da rodada, dia a dia
+    por_dia = {}
+    for dados in lista:
+        momento = datetime.fromisoformat(dados["momento"])
+        dia = timezone.localtime(momento).date()
+        momento_dia, quantidades = por_dia.setdefault(dia, [momento, defaultdict(int)])
+        por_dia[dia][0] = max(momento_dia, momento)
+        for pid, qtd in dados["quantidades"].items():
+            quantidades[int(pid)] += qtd
+
+    for dia, (momento, quantidades) in sorted(por_dia.items()):
+        registrar_saidas(quantidades, momento=momento)
+
+
+@tarefa("limpar_estoque_zerado", em_lote=True)
+def limpar_estoque_zerado(lista):
+    # Só os produtos das vendas da rodada, travados na ordem de sempre antes de apagar
+    produtos = sorted({pid for dados in lista for pid in dados["produtos"]})
+    travar_lotes(produtos)
+    Estoque.objects.filter(produtos_id__in=produtos, quantidade__lte=0).delete()
@@ -1,10 +1,126 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from datetime import datetime
-from core.models import Despesa, Venda, FinanceiroMes
+from core import catalogo
+from core.models import Despesa, Venda, ItemVenda, Produtos, CategoriaProduto, ComponenteProduto, Estoque
+from core.services import adiar_fechamento, adiar_venda_diaria
+
+# Campos que afetam o fechamento mensal; guardados ao carregar para calcular a diferença ao salvar
+CAMPOS_FINANCEIROS = {
+    Venda: ("valor_liquido", "valor_bruto", "forma_pagamento", "usuario_id", "data"),
+    Despesa: ("valor", "data"),
+    ItemVenda: ("ganho_unitario", "quantidade"),
+}
+
+
+def _ganho_item(ganho_unitario, quantidade):
+    return (ganho_unitario or 0) * (quantidade or 0)
+
+
+def _data_venda(venda_id):
+    return Venda.objects.filter(pk=venda_id).values_list("data", flat=True).first()
+
+
+def _venda_diaria(valores, sinal):
+    """Entra (sinal=1) ou sai (sinal=-1) com uma venda do resumo diário."""
+    adiar_venda_diaria(
+        valores.get("data"), valores.get("forma_pagamento"), valores.get("usuario_id"),
+        quantidade=sinal,
+        bruto=sinal * (valores.get("valor_bruto") or 0),
+        liquido=sinal * (valores.get("valor_liquido") or 0),
+    )
+
+
+@receiver(post_init, sender=Venda)
+@receiver(post_init, sender=Despesa)
+@receiver(post_init, sender=ItemVenda)
+def guardar_valores_originais(sender, instance, **kwargs):
+    # Só lê o que já veio do banco: campos adiados (.only/.defer) são buscados no pre_save
+    instance._valores_originais = {
+        campo: instance.__dict__[campo]
+        for campo in CAMPOS_FINANCEIROS[sender] if campo in instance.__dict__
+    }
+
+
+@receiver(pre_save, sender=Venda)
+@receiver(pre_save, sender=Despesa)
+@receiver(pre_save, sender=ItemVenda)
+def completar_valores_originais(sender, instance, **kwargs):
+    faltando = [c for c in CAMPOS_FINANCEIROS[sender] if c not in instance._valores_originais]
+    if instance.pk and faltando:
+        instance._valores_originais.update(sender.objects.filter(pk=instance.pk).values(*faltando).first() or {})
+
 
-@receiver(post_save, sender=Despesa)
 @receiver(post_save, sender=Venda)
-def atualizar_fechamento(sender, instance, **kwargs):
-    agora = datetime.now()
-    FinanceiroMes.gerar_ou_atualizar(mes=agora.month, ano=agora.year)
+def atualizar_fechamento_venda(sender, instance, created, **kwargs):
+    original = {} if created else instance._valores_originais
+    atual = {campo: getattr(instance, campo) for campo in CAMPOS_FINANCEIROS[Venda]}
+    adiar_fechamento(instance.data, liquido=(instance.valor_liquido or 0) - (original.get("valor_liquido") or 0))
+    if original != atual:
+        # Quitação/edição: sai da linha antiga do resumo diário e entra na nova
+        if not created:
+            _venda_diaria(original, -1)
+        _venda_diaria(atual, 1)
+    instance._valores_originais = atual
+
+
+@receiver(post_save, sender=Despesa)
+def atualizar_fechamento_despesa(sender, instance, created, **kwargs):
+    if not created:
+        original = instance._valores_originais
+        adiar_fechamento(original.get("data"), despesas=-(original.get("valor") or 0))
+    adiar_fechamento(instance.data, despesas=instance.valor or 0)
+    instance._valores_originais = {"valor": instance.valor, "data": instance.data}
+
+
+@receiver(post_save, sender=ItemVenda)
+def atualizar_fechamento_item(sender, instance, created, **kwargs):
+    # Itens gravados com bulk_create no checkout já entram pelo services.criar_itens_venda
+    ganho = _ganho_item(instance.ganho_unitario, instance.quantidade)
+    if not created:
+        original = instance._valores_originais
+        ganho -= _ganho_item(original.get("ganho_unitario"), original.get("quantidade"))
+    adiar_fechamento(_data_venda(instance.venda_id), ganho=ganho)
+    instance._valores_originais = {"ganho_unitario": instance.ganho_unitario, "quantidade": instance.quantidade}
+
+
+@receiver(pre_delete, sender=Venda)
+def descontar_venda_excluida(sender, instance, **kwargs):
+    adiar_fechamento(instance.data, liquido=-(instance.valor_liquido or 0))
+    _venda_diaria({campo: getattr(instance, campo) for campo in CAMPOS_FINANCEIROS[Venda]}, -1)
+
+
+@receiver(pre_delete, sender=ItemVenda)
+def descontar_item_excluido(sender, instance, **kwargs):
+    # pre_delete: a venda ainda existe quando a exclusão vem em cascata
+    ganho = _ganho_item(instance.ganho_unitario, instance.quantidade)
+    adiar_fechamento(_data_venda(instance.venda_id), ganho=-ganho)
+
+
+@receiver(pre_delete, sender=Despesa)
+def descontar_despesa_excluida(sender, instance, **kwargs):
+    adiar_fechamento(instance.data, despesas=-(instance.valor or 0))
+
+
+@receiver(pre_delete, sender=Estoque)
+def descontar_lote_excluido(sender, instance, origin=None, **kwargs):
+    # Vale também para exclusões em massa (queryset.delete, "excluir selecionados" do admin).
+    # Na cascata de um produto excluído não há saldo a acertar.
+    if isinstance(origin, Produtos) or getattr(origin, "model", None) is Produtos:
+        return
+    Produtos.ajustar_estoque({instance.produtos_id: -(instance.quantidade or 0)})
+
+
+@receiver(post_save, sender=Produtos)
+@receiver(post_delete, sender=Produtos)
+@receiver(post_save, sender=CategoriaProduto)
+@receiver(post_delete, sender=CategoriaProduto)
+@receiver(post_save, sender=ComponenteProduto)
+@receiver(post_delete, sender=ComponenteProduto)
+def invalidar_catalogo(sender, **kwargs):
+    catalogo.invalidar()
+
+
+@receiver(post_save, sender=Estoque)
+@receiver(post_delete, sender=Estoque)
+def invalidar_estoque(sender, **kwargs):
+    catalogo.invalidar("estoque")
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Tarefa
+
+# tipo -> (função, em_lote)
+TAREFAS = {}
+MAX_TENTATIVAS = 5
+
+
+def tarefa(tipo, em_lote=False):
+    """
+    Registra a função que executa as tarefas de `tipo`.
+
+    Normalmente a função recebe os `dados` da tarefa como argumentos nomeados. Com
+    `em_lote`, recebe a lista com os `dados` de todas as tarefas desse tipo reservadas
+    na mesma rodada, para juntar o trabalho (ex.: uma atualização por mês em vez de uma por venda).
+    """
+    def registrar(func):
+        TAREFAS[tipo] = (func, em_lote)
+        return func
+    return registrar
+
+
+def enfileirar(tipo, dados=None, atraso=0):
+    """
+    Grava uma tarefa para o worker. Dentro de uma transação, ela só fica visível
+    depois do commit e desaparece junto num rollback.
+
+    `atraso` (segundos) adia a execução; num tipo `em_lote`, isso deixa os pedidos
+    que chegarem nesse meio-tempo para a mesma rodada.
+    """
+    Tarefa.objects.create(tipo=tipo, dados=dados or {}, executar_em=timezone.now() + timedelta(seconds=atraso))
+
+
+def reservar(limite=100):
+    """Marca como 'executando' até `limite` tarefas vencidas; outros workers pulam as travadas."""
+    agora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Tarefa.objects.select_for_update(skip_locked=True)
+            .filter(status='pendente', executar_em__lte=agora)
+            .order_by('executar_em', 'pk')
+            .values_list('pk', flat=True)[:limite]
+        )
+        Tarefa.objects.filter(pk__in=ids).update(status='executando', atualizado=agora)
+    return list(Tarefa.objects.filter(pk__in=ids).order_by('executar_em', 'pk'))
+
+
+def _registrar_falha(tarefas, erro):
+    agora = timezone.now()
+    for t in tarefas:
+        t.tentativas += 1
+        t.erro = f"{type(erro).__name__}: {erro}"
+        if t.tentativas >= MAX_TENTATIVAS:
+            t.status = 'falhou'
+        else:
+            t.status = 'pendente'
+            t.executar_em = agora + timedelta(seconds=2 ** t.tentativas)
+        t.save(update_fields=['tentativas', 'erro', 'status', 'executar_em', 'atualizado'])
+
+
+def processar(limite=100):
+    """Executa uma rodada de tarefas vencidas. Retorna quantas foram reservadas."""
+    tarefas = reservar(limite)
+
+    por_tipo = defaultdict(list)
+    for t in tarefas:
+        por_tipo[t.tipo].append(t)
+
+    for tipo, grupo in por_tipo.items():
+        func, em_lote = TAREFAS.get(tipo, (None, False))
+        for lote in ([grupo] if em_lote else [[t] for t in grupo]):
+            try:
+                with transaction.atomic():
+                    if func is None:
+                        raise LookupError(f"Tarefa desconhecida: {tipo}")
+                    if em_lote:
+                        func([t.dados for t in lote])
+                    else:
+                        func(**lote[0].dados)
+            except Exception as erro:
+                _registrar_falha(lote, erro)
+            else:
+                Tarefa.objects.filter(pk__in=[t.pk for t in lote]).update(
+                    status='concluida', erro='', atualizado=timezone.now()
+                )
+
+    return len(tarefas)
+
+
+def liberar_travadas(minutos=10):
+    """Devolve para a fila tarefas 'executando' de um worker que morreu no meio."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return Tarefa.objects.filter(status='executando', atualizado__lt=limite).update(
+        status='pendente', atualizado=timezone.now()
+    )
+
+
+def limpar_concluidas(dias=7):
+    limite = timezone.now() - timedelta(days=dias)
+    return Tarefa.objects.filter(status='concluida', atualizado__lt=limite).delete()[0]
@@ -4,7 +4,8 @@ from .views import (vender, estoque, lead_dash, produtos, adicionar_estoque,
                     profile, estoque_adicao_massa, baixa_geral_estoque, usuario_criar, baixa_unica,
                     cadastrar_produto, get_venda_itens, quitar_venda, dash_stock, editar_saida, remover_saida
                     , dash_stock_grafico,  lista_compras, dashboard_estoque, financeiro_mensal,
-                    gerar_backup, criar_usuario_padrao, quitar_pendente, editar_produto)  # ou importe as views necessárias
+                    gerar_backup, criar_usuario_padrao, quitar_pendente, editar_produto, status_tarefas,
+                    buscar_por_codigo, exportar_vendas_csv, estoque_produtos_json, estoque_lotes_json)  # ou importe as views necessárias
 from django.conf import settings
 from django.conf.urls.static import static
 from .views import login_view
@@ -15,8 +16,11 @@ urlpatterns = [
     path('login/', login_view, name='login'),
     path('logout/', LogoutView.as_view(next_page='login'), name='logout'),
     path('', vender, name='vender'),
+    path('produto/codigo/', buscar_por_codigo, name='produto_por_codigo'),
     path('quitar-pendente/', quitar_pendente, name='quitar_pendente'),  # ✅ nova URL
     path('stock/', estoque, name='estoque'),
+    path('stock/produtos.json', estoque_produtos_json, name='estoque_produtos_json'),
+    path('stock/lotes.json', estoque_lotes_json, name='estoque_lotes_json'),
     path('stock/adicao-massa/', estoque_adicao_massa, name='estoque_adicao_massa'),
     path('stock/baixar-geral/', baixa_geral_estoque, name='estoque_baixa_geral'),
     path("stock/baixa-unica/", baixa_unica, name="baixa_unica"),
@@ -32,6 +36,7 @@ urlpatterns = [
     path("dash/balance/", financeiro_mensal, name='balanco'),
     path('criar-usuario-padrao/', criar_usuario_padrao, name='criar_usuario_padrao'),
     path('dash/vendas/', dash_vendas, name='dash_vendas'),
+    path('dash/vendas/exportar/', exportar_vendas_csv, name='exportar_vendas_csv'),
     path('venda/<int:venda_id>/itens/', get_venda_itens, name='get_venda_itens'),
     path('venda/quitar/<int:venda_id>/', quitar_venda, name='quitar_venda'),
     path('dash/vendas/graficos/', dash_vendas_graficos, name='dash_vendas_graficos'),
@@ -45,5 +50,6 @@ urlpatterns = [
     path('produtos/excluir/<int:produto_id>/', excluir_produto, name='excluir_produto'),
     path('finalizar-venda/', finalizar_venda, name='finalizar_venda'),
     path('gerar-backup/', gerar_backup, name='gerar_backup'),
+    path('dash/tarefas/', status_tarefas, name='status_tarefas'),
 
 ]+ static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -12,8 +12,16 @@ from django.contrib.auth import authenticate, login
 
 from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
+from django.db.models import ProtectedError
 
 from .models import CategoriaDespesas
+from .catalogo import dados_vender, produto_por_codigo
+from .datas import periodo, dias_do_mes
+from .paginacao import paginar_keyset
+from .models import normalizar_busca
+from .services import (
+    baixar_estoque, montar_carrinho, receber_estoque, registrar_venda, verificar_disponibilidade,
+)
 
 
 def login_view(request):
@@ -37,64 +45,6 @@ def login_view(request):
 from django.utils import timezone
 
 
-def abater_estoque(produto: Produtos, quantidade: int) -> int:
-    """
-    Abate a quantidade do produto no estoque (por lote mais antigo).
-    Remove estoques zerados e cria/atualiza SaidaEstoque do mesmo dia.
-    Retorna o total abatido.
-    """
-    estoque_total = (
-            Estoque.objects.filter(produtos=produto).aggregate(total=Sum("quantidade"))["total"] or 0
-    )
-    if estoque_total <= 0:
-        return 0
-
-    quantidade_restante = min(quantidade, estoque_total)
-    total_abatido = 0
-    hoje = timezone.localdate()
-
-    with transaction.atomic():
-        estoques = (
-            Estoque.objects.select_for_update()
-            .filter(produtos=produto, quantidade__gt=0)
-            .order_by("lote", "pk")
-        )
-
-        for estoque_item in estoques:
-            if quantidade_restante <= 0:
-                break
-
-            abate = min(estoque_item.quantidade, quantidade_restante)
-            estoque_item.quantidade -= abate
-            estoque_item.save(update_fields=["quantidade"])
-            quantidade_restante -= abate
-            total_abatido += abate
-
-            # 🔥 Remove estoque se zerar
-            if estoque_item.quantidade <= 0:
-                estoque_item.delete()
-
-        # 🔥 Gera ou atualiza registro de Saída (sem usar __date)
-        if total_abatido > 0:
-            saida = SaidaEstoque.objects.filter(
-                produto=produto, data_saida__date=hoje
-            ).first()
-
-            if saida:
-                saida.quantidade += total_abatido
-                saida.save(update_fields=["quantidade"])
-            else:
-                SaidaEstoque.objects.create(
-                    produto=produto,
-                    data_saida=timezone.now(),
-                    quantidade=total_abatido,
-                    nome_produto=produto.nome_produto,
-                    codigo_produto=produto.codigo,
-                )
-
-    return total_abatido
-
-
 @csrf_exempt
 def finalizar_venda(request):
     if request.method != "POST":
@@ -132,103 +82,20 @@ def finalizar_venda(request):
         if forma_pagamento == "dinheiro" and valor_pago > valor_liquido:
             troco = (valor_pago - valor_liquido).quantize(Decimal("0.01"))
 
-        with transaction.atomic():
-            estoque_insuficiente = []
-
-            # 1️⃣ Abate estoque
-            for item in carrinho:
-                produto = Produtos.objects.get(id=item["id"])
-                categoria = (produto.categoria.nome_categoria or "").lower()
-                qtd_solicitada = int(item.get("qtd", 0))
-
-                # Produtos normais: abate estoque
-                if categoria not in ["combos", "doses", "fracionados"]:
-                    abatido = abater_estoque(produto, qtd_solicitada)
-                    if abatido < qtd_solicitada:
-                        estoque_insuficiente.append(
-                            f"{produto.nome_produto} (Disponível: {abatido}, Necessário: {qtd_solicitada})"
-                        )
-
-                # Complementos (gelo sempre obrigatório para combos/doses)
-                # 🧊 Complementos de gelo (padrão diferente para combos)
-                gelo_items = [comp for comp in item.get("complementos", []) if comp["tipo"] == "gelo"]
-                for gelo in gelo_items:
-                    produto_comp = Produtos.objects.get(id=gelo["id"])
-
-                    # 🔥 Se for combo e não tiver quantidade definida maior, usa padrão de 5
-                    if categoria == "combos":
-                        qtd_comp = int(gelo.get("qtd", 0)) or 5
-                    else:
-                        qtd_comp = int(gelo.get("qtd", 0))
-
-                    abatido = abater_estoque(produto_comp, qtd_comp)
-                    if abatido < qtd_comp:
-                        estoque_insuficiente.append(
-                            f"{produto_comp.nome_produto} (Disponível: {abatido}, Necessário: {qtd_comp})"
-                        )
-
-                # Red Bull (opcional)
-                rb_items = [comp for comp in item.get("complementos", []) if comp["tipo"] == "rb"]
-                for rb in rb_items:
-                    produto_comp = Produtos.objects.get(id=rb["id"])
-                    qtd_comp = int(rb.get("qtd", 0))  # ✅ corrigido
-                    abatido = abater_estoque(produto_comp, qtd_comp)
-                    if abatido < qtd_comp:
-                        estoque_insuficiente.append(
-                            f"{produto_comp.nome_produto} (Disponível: {abatido}, Necessário: {qtd_comp})"
-                        )
-
-            if estoque_insuficiente:
-                raise ValueError("Estoque insuficiente: " + ", ".join(estoque_insuficiente))
-
-            # 2️⃣ Cria venda
-            venda = Venda.objects.create(
-                usuario=usuario,
-                forma_pagamento=forma_pagamento,
-                valor_bruto=valor_bruto,
-                desconto_total=desconto_total,
-                taxa=taxa_aplicada,
-                valor_liquido=valor_liquido,
-                nome_cliente=nome_cliente,
-            )
-
-            # 3️⃣ Cria itens da venda
-            for item in carrinho:
-                produto = Produtos.objects.get(id=item["id"])
-                categoria = (produto.categoria.nome_categoria or "").lower()
-                qtd_solicitada = int(item.get("qtd", 0))
-                preco_unitario = Decimal(str(item["preco"]))
-                valor_item_bruto = preco_unitario * qtd_solicitada
-                desconto_item = round((valor_item_bruto / valor_bruto) * desconto_total, 2) if valor_bruto > 0 else 0
-                valor_item_liquido = max(valor_item_bruto - desconto_item, 0)
-
-                # Item principal
-                ItemVenda.objects.create(
-                    venda=venda,
-                    produto=produto,
-                    quantidade=qtd_solicitada,
-                    valor_unitario=preco_unitario,
-                    valor_total=valor_item_liquido,
-                    desconto=desconto_item,
-                )
-
-                # 🧾 Complementos: gelo + Red Bull
-                for comp in item.get("complementos", []):
-                    produto_comp = Produtos.objects.get(id=comp["id"])
-
-                    if categoria == "combos" and comp["tipo"] == "gelo":
-                        qtd_comp = int(comp.get("qtd", 0)) or 5
-                    else:
-                        qtd_comp = int(comp.get("qtd", 0))
-
-                    ItemVenda.objects.create(
-                        venda=venda,
-                        produto=produto_comp,
-                        quantidade=qtd_comp,
-                        valor_unitario=produto_comp.preco_venda,
-                        valor_total=produto_comp.preco_venda * qtd_comp,
-                        desconto=0,
-                    )
+        # Carrega produtos, categorias e complementos numa única consulta
+        linhas, demanda, produtos_carrinho = montar_carrinho(carrinho)
+        verificar_disponibilidade(demanda, produtos_carrinho)
+
+        venda = registrar_venda(
+            linhas, demanda, produtos_carrinho,
+            valor_bruto=valor_bruto,
+            desconto_total=desconto_total,
+            usuario=usuario,
+            forma_pagamento=forma_pagamento,
+            taxa=taxa_aplicada,
+            valor_liquido=valor_liquido,
+            nome_cliente=nome_cliente,
+        )
 
         return JsonResponse({
             "sucesso": True,
@@ -257,52 +124,60 @@ def vender(request):
     categoria_filtro = request.GET.get("categoria", "").strip()
     pagina = request.GET.get("pagina", 1)
 
+    # --- Catálogo (em cache, invalidado a cada alteração de produto/categoria) ---
+    catalogo = dados_vender()
+
     # --- FILTRO DE PRODUTOS ---
-    produtos_query = Produtos.objects.select_related("categoria").all()
+    produtos_lista = catalogo["produtos"]
     if busca:
-        produtos_query = produtos_query.filter(
-            Q(nome_produto__icontains=busca) | Q(codigo__icontains=busca)
-        )
+        termo = normalizar_busca(busca)
+        produtos_lista = [p for p in produtos_lista if termo in p.nome_busca]
     if categoria_filtro:
-        produtos_query = produtos_query.filter(
-            categoria__nome_categoria__iexact=categoria_filtro
-        )
-    produtos_query = produtos_query.order_by(
-        Case(
-            When(categoria__nome_categoria="Doses", then=0),
-            default=1,
-            output_field=IntegerField()
-        ),
-        'nome_produto'
-    )
-    paginator = Paginator(produtos_query, 9)
+        produtos_lista = [
+            p for p in produtos_lista
+            if p.categoria.nome_categoria.lower() == categoria_filtro.lower()
+        ]
+    paginator = Paginator(produtos_lista, 9)
     produtos_paginados = paginator.get_page(pagina)
 
-    # --- Dados auxiliares ---
-    gelos = Produtos.objects.filter(categoria__nome_categoria__iexact="Gelos")
-    redbulls = Produtos.objects.filter(
-        categoria__nome_categoria__iexact="Energeticos",
-        nome_produto__icontains="redbull"
-    ).order_by("nome_produto")
-    categorias = CategoriaProduto.objects.values_list("nome_categoria", flat=True).order_by("nome_categoria")
     categorias_com_gelo = ["Doses", "Combos"]
 
     # --- Vendas do dia ---
-    vendas_dia = Venda.objects.filter(data__date=hoje).prefetch_related('itens', 'itens__produto').order_by("-data")
+    vendas_dia = Venda.objects.filter(**periodo("data", hoje, hoje)).prefetch_related('itens', 'itens__produto').order_by("-data")
 
     # --- Renderiza diretamente os objetos para o template ---
     return render(request, "vender.html", {
         "produtos_paginados": produtos_paginados,
         "vendas_dia": vendas_dia,
-        "categorias": categorias,
-        "gelos": list(gelos),
-        "redbulls": list(redbulls),
+        "categorias": catalogo["categorias"],
+        "gelos": catalogo["gelos"],
+        "redbulls": catalogo["redbulls"],
         "filtro_busca": busca,
         "filtro_categoria": categoria_filtro,
         "categorias_com_gelo": categorias_com_gelo,
     })
 
 
+def buscar_por_codigo(request):
+    """Leitor de código de barras do caixa: busca exata pelo código, sem passar pelo banco."""
+    codigo = request.GET.get("codigo", "").strip()
+    produto = produto_por_codigo(codigo) if codigo else None
+    if produto is None:
+        return JsonResponse({"sucesso": False, "erro": "Produto não encontrado"}, status=404)
+
+    return JsonResponse({
+        "sucesso": True,
+        "produto": {
+            "id": produto.id,
+            "codigo": produto.codigo,
+            "nome_produto": produto.nome_produto,
+            "preco_venda": str(produto.preco_venda),
+            "categoria": produto.categoria.nome_categoria,
+            "imagem": produto.imagem.url if produto.imagem else "",
+        },
+    })
+
+
 from decimal import Decimal, ROUND_HALF_UP
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -333,40 +208,42 @@ def quitar_pendente(request):
         if not venda_id or not nova_forma_pagamento:
             return JsonResponse({"sucesso": False, "erro": "Dados incompletos"})
 
-        venda = get_object_or_404(Venda, id=venda_id)
-
-        if venda.forma_pagamento != "pendente":
-            return JsonResponse({"sucesso": False, "erro": "Venda não é pendente"})
-
-        # --- TAXAS COMO DECIMAL ---
-        TAXAS = {
-            "cartao_debito": Decimal("1.99"),
-            "cartao_credito": Decimal("1.99"),
-            "pix_qrcode": Decimal("4.99"),
-            "pix": Decimal("0"),
-            "dinheiro": Decimal("0"),
-        }
-
-        # Valores como Decimal
-        valor_bruto = Decimal(str(venda.valor_bruto or "0.00"))
-        desconto_total = Decimal(str(venda.desconto_total or "0.00"))
-        valor_com_desconto = max(valor_bruto - desconto_total, Decimal("0.00"))
-
-        taxa_percentual = TAXAS.get(nova_forma_pagamento, Decimal("0.00"))
-
-        # Calcula a taxa aplicada e valor líquido
-        taxa_aplicada = (valor_com_desconto * taxa_percentual / Decimal("100")).quantize(
-            Decimal("0.01"), rounding=ROUND_HALF_UP
-        )
-        valor_liquido = (valor_com_desconto - taxa_aplicada).quantize(
-            Decimal("0.01"), rounding=ROUND_HALF_UP
-        )
+        with transaction.atomic():
+            # Trava a venda: dois cliques/terminais quitando ao mesmo tempo não cobram duas vezes
+            venda = get_object_or_404(Venda.objects.select_for_update(), id=venda_id)
+
+            if venda.forma_pagamento != "pendente":
+                return JsonResponse({"sucesso": False, "erro": "Venda não é pendente"})
+
+            # --- TAXAS COMO DECIMAL ---
+            TAXAS = {
+                "cartao_debito": Decimal("1.99"),
+                "cartao_credito": Decimal("1.99"),
+                "pix_qrcode": Decimal("4.99"),
+                "pix": Decimal("0"),
+                "dinheiro": Decimal("0"),
+            }
+
+            # Valores como Decimal
+            valor_bruto = Decimal(str(venda.valor_bruto or "0.00"))
+            desconto_total = Decimal(str(venda.desconto_total or "0.00"))
+            valor_com_desconto = max(valor_bruto - desconto_total, Decimal("0.00"))
+
+            taxa_percentual = TAXAS.get(nova_forma_pagamento, Decimal("0.00"))
+
+            # Calcula a taxa aplicada e valor líquido
+            taxa_aplicada = (valor_com_desconto * taxa_percentual / Decimal("100")).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
+            valor_liquido = (valor_com_desconto - taxa_aplicada).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
 
-        # Atualiza venda
-        venda.forma_pagamento = nova_forma_pagamento
-        venda.taxa = taxa_aplicada
-        venda.valor_liquido = valor_liquido
-        venda.save()
+            # Atualiza venda
+            venda.forma_pagamento = nova_forma_pagamento
+            venda.taxa = taxa_aplicada
+            venda.valor_liquido = valor_liquido
+            venda.save()
 
         return JsonResponse({
             "sucesso": True,
@@ -402,22 +279,17 @@ def _status_validade(data_validade):
 def produtos(request):
     busca = request.GET.get('busca', '')
     categoria_id = request.GET.get('categoria', '')
-    pagina = request.GET.get('page', 1)  # Página atual
-
-    produtos_qs = Produtos.objects.all().order_by('nome_produto')  # ou qualquer campo desejado
+    produtos_qs = Produtos.objects.all()
 
     if busca:
-        produtos_qs = produtos_qs.filter(
-            Q(nome_produto__icontains=busca) | Q(codigo__icontains=busca)
-        )
+        produtos_qs = produtos_qs.filter(Produtos.filtro_busca(busca))
     if categoria_id:
         produtos_qs = produtos_qs.filter(categoria_id=categoria_id)
 
     categorias = CategoriaProduto.objects.all()
 
-    # Paginação
-    paginator = Paginator(produtos_qs, 12)  # 12 produtos por página
-    produtos_paginados = paginator.get_page(pagina)
+    # Paginação por cursor (nome, id): 12 produtos por página
+    produtos_paginados = paginar_keyset(produtos_qs, ['nome_produto', 'id'], request.GET, 12)
 
     # Checar se há despesas
     despesas_vazias = not Despesa.objects.exists()
@@ -545,6 +417,14 @@ def excluir_produto(request, produto_id):
             return JsonResponse({'success': True, 'message': '✅ Produto excluído com sucesso!'})
         except Produtos.DoesNotExist:
             return JsonResponse({'success': False, 'message': '❌ Produto não encontrado.'}, status=404)
+        except ProtectedError:
+            # Componente de receita (ComponenteProduto.componente é PROTECT): tire-o das receitas antes
+            receitas = sorted(produto.usado_em.values_list('produto__nome_produto', flat=True))
+            return JsonResponse({
+                'success': False,
+                'message': f"❌ Produto usado na receita de: {', '.join(receitas)}. "
+                           "Remova-o dessas receitas antes de excluir.",
+            }, status=409)
     return JsonResponse({'success': False, 'message': 'Método inválido.'}, status=405)
 
 
@@ -558,13 +438,8 @@ def baixa_geral_estoque(request):
             data = json.loads(request.body)
             produtos = data.get("produtos", [])
 
-            for item in produtos:
-                estoque = Estoque.objects.get(id=item["id"])
-                qtd_remover = int(item.get("qtd_remover", 0))
-
-                if qtd_remover > 0 and qtd_remover <= estoque.quantidade:
-                    estoque.quantidade -= qtd_remover
-                    estoque.save()
+            # Abate os lotes, apaga os zerados e registra as saídas do dia numa transação só
+            baixar_estoque(produtos)
 
             # Buscar estoque atualizado (sem combos e doses, quantidade > 0)
             estoque_list = (
@@ -605,36 +480,8 @@ def estoque_adicao_massa(request):
             data = json.loads(request.body)
             itens = data.get("itens", [])
 
-            for item in itens:
-                produto = Produtos.objects.get(id=item["id"])
-                quantidade = int(item["quantidade"])
-                validade = item.get("validade")
-                if validade:
-                    validade = datetime.strptime(validade, "%Y-%m-%d").date()
-
-                # Procura estoque existente
-                if validade:
-                    estoque_existente = Estoque.objects.filter(
-                        produtos=produto,
-                        data_validade=validade
-                    ).first()
-                else:
-                    estoque_existente = Estoque.objects.filter(
-                        produtos=produto,
-                        data_validade__isnull=True
-                    ).first()
-
-                if estoque_existente:
-                    # Soma quantidade existente
-                    estoque_existente.quantidade += quantidade
-                    estoque_existente.save()
-                else:
-                    # Cria novo registro
-                    Estoque.objects.create(
-                        produtos=produto,
-                        quantidade=quantidade,
-                        data_validade=validade if validade else None
-                    )
+            # Valida tudo, junta por (produto, validade) e grava numa transação só
+            receber_estoque(itens)
 
             return JsonResponse({"sucesso": True})
         except Exception as e:
@@ -654,45 +501,66 @@ def baixa_unica(request):
     try:
         data = json.loads(request.body)
         produto_id = data.get("produto_id")
-        qtd = int(data.get("quantidade"))
+        try:
+            qtd = int(data.get("quantidade"))
+        except (TypeError, ValueError):
+            qtd = 0
+        if qtd <= 0:
+            return JsonResponse({"error": "Quantidade deve ser maior que zero."}, status=400)
 
-        estoque_item = Estoque.objects.select_related("produtos").filter(id=produto_id).first()
+        estoque_item = Estoque.objects.filter(id=produto_id).first()
         if not estoque_item:
             return JsonResponse({"error": "Produto não encontrado."}, status=404)
 
         if estoque_item.quantidade < qtd:
             return JsonResponse({"error": "Quantidade insuficiente no estoque."}, status=400)
 
-        produto = estoque_item.produtos
+        # Mesmo caminho da baixa geral: abate o lote, apaga se zerar, soma a saída do dia
+        # e registra a baixa no livro de estoque
+        saidas = baixar_estoque([{"id": estoque_item.id, "qtd_remover": qtd}])
 
-        # Reduz a quantidade do estoque
-        estoque_item.quantidade -= qtd
-        estoque_item.save()
+        return JsonResponse({"success": True, "saida_id": saidas[estoque_item.produtos_id]})
 
-        # Verifica se já existe saída para este produto hoje
-        from django.utils import timezone
-        hoje = timezone.now().date()
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
-        saida, created = SaidaEstoque.objects.get_or_create(
-            produto=produto,
-            nome_produto=produto.nome_produto,
-            codigo_produto=produto.codigo,
-            data_saida__date=hoje,
-            defaults={"quantidade": 0}
-        )
 
-        # Atualiza a quantidade da saída
-        saida.quantidade += qtd
-        saida.save()
+from django.db.models import CharField, Value
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+from django.contrib.auth.decorators import login_required
+from datetime import datetime, timezone as dt_timezone
+from . import catalogo
 
-        # Apaga o estoque se zerar
-        if estoque_item.quantidade <= 0:
-            estoque_item.delete()
 
-        return JsonResponse({"success": True, "saida_id": saida.id})
+# ========== LISTAS DA TELA DE ESTOQUE (JSON com ETag/Last-Modified) ==========
+# O navegador revalida com If-None-Match e recebe 304 enquanto catálogo e estoque não mudarem;
+# entre workers, o JSON pronto fica no cache compartilhado sob as mesmas versões.
+def _etag_estoque(request):
+    return f'"{catalogo.versao("catalogo")}-{catalogo.versao("estoque")}"'
+
+
+def _modificado_estoque(request):
+    ultima = max(catalogo.versao("catalogo"), catalogo.versao("estoque"))
+    return datetime.fromtimestamp(ultima / 1e9, tz=dt_timezone.utc)
+
+
+def _resposta_json_revalidavel(conteudo):
+    resposta = HttpResponse(conteudo, content_type="application/json")
+    resposta["Cache-Control"] = "private, no-cache"
+    return resposta
+
+
+@login_required(login_url='login')
+@condition(etag_func=_etag_estoque, last_modified_func=_modificado_estoque)
+def estoque_produtos_json(request):
+    return _resposta_json_revalidavel(catalogo.produtos_estoque_json())
 
-    except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
+
+@login_required(login_url='login')
+@condition(etag_func=_etag_estoque, last_modified_func=_modificado_estoque)
+def estoque_lotes_json(request):
+    return _resposta_json_revalidavel(catalogo.lotes_estoque_json())
 
 
 def estoque(request):
@@ -701,9 +569,6 @@ def estoque(request):
         Q(nome_categoria__iexact="doses") | Q(nome_categoria__iexact="combos")
     ).order_by('nome_categoria')
 
-    # ======= LIMPEZA AUTOMÁTICA =======
-    Estoque.objects.filter(quantidade__lte=0).delete()
-
     # ========== FORM DE CADASTRO ==========
     if request.method == "POST":
         estoque_form = EstoqueForm(request.POST)
@@ -719,7 +584,7 @@ def estoque(request):
     categoria_id = request.GET.get("categoria", "")
 
     # CRUCIAL: 'hoje' deve ser definida aqui, antes de qualquer lógica que a utilize.
-    hoje = now().date()
+    hoje = timezone.localdate()  # dia no fuso da loja (now().date() é o dia em UTC)
 
     estoque_qs = (
         Estoque.objects
@@ -728,42 +593,13 @@ def estoque(request):
             Q(produtos__categoria__nome_categoria__iexact="doses") |
             Q(produtos__categoria__nome_categoria__iexact="combos")
         )
-        .order_by("lote", "quantidade")
-    )
-
-    # --- JSONs (MANTIDOS E INALTERADOS) ---
-    todos_produtos = Produtos.objects.exclude(
-        Q(categoria__nome_categoria__iexact="doses") | Q(categoria__nome_categoria__iexact="combos")
-    ).order_by('nome_produto')
-
-    produtos_list = list(todos_produtos.values(
-        "id", "nome_produto", "codigo", "imagem"
-    ))
-    todos_produtos_json = json.dumps(produtos_list, cls=DjangoJSONEncoder)
-
-    estoque_list = (
-        Estoque.objects
-        .select_related("produtos")
-        .exclude(
-            Q(produtos__categoria__nome_categoria__iexact="doses") |
-            Q(produtos__categoria__nome_categoria__iexact="combos")
-        )
-        .filter(quantidade__gt=0)
-        .order_by("lote", "quantidade")
-        .values(
-            "id", "produtos__id", "produtos__nome_produto", "produtos__codigo",
-            "produtos__imagem", "quantidade", "lote", "data_validade"
-        )
+        .filter(quantidade__gt=0)  # lotes zerados são apagados pelo worker
+        .order_by("lote", "quantidade", "pk")  # pk: ordem estável entre páginas
     )
-    estoque_json = json.dumps(list(estoque_list), cls=DjangoJSONEncoder)
-    # -------------------------------------
 
     # ========== FILTRO DE BUSCA ==========
     if busca:
-        estoque_qs = estoque_qs.filter(
-            Q(produtos__nome_produto__icontains=busca) |
-            Q(produtos__codigo__icontains=busca)
-        )
+        estoque_qs = estoque_qs.filter(Produtos.filtro_busca(busca, prefixo='produtos__'))
 
     # ========== FILTRO DE CATEGORIA (Corrigido o escopo/indentação) ==========
     if categoria_id:
@@ -779,26 +615,19 @@ def estoque(request):
         fim = hoje + timedelta(days=6)
         estoque_qs = estoque_qs.filter(data_validade__range=(inicio, fim))
 
-    # ========== ANOTAÇÃO DE BORDA ==========
-    estoque_com_borda = []
-    for item in estoque_qs:
-        # 'hoje' está definida e disponível aqui!
-        if not item.data_validade:
-            borda = "borda-cinza"
-        elif item.data_validade < hoje:
-            borda = "borda-preta"
-        elif item.data_validade <= hoje + timedelta(days=15):
-            borda = "borda-vermelha"
-        else:
-            borda = "borda-verde"
-
-        estoque_com_borda.append({
-            "obj": item,
-            "borda": borda,
-        })
+    # ========== ANOTAÇÃO DE BORDA (no banco, relativa a hoje) ==========
+    estoque_qs = estoque_qs.annotate(
+        borda=Case(
+            When(data_validade__isnull=True, then=Value("borda-cinza")),
+            When(data_validade__lt=hoje, then=Value("borda-preta")),
+            When(data_validade__lte=hoje + timedelta(days=15), then=Value("borda-vermelha")),
+            default=Value("borda-verde"),
+            output_field=CharField(),
+        )
+    )
 
-    # ========== PAGINAÇÃO ==========
-    paginator = Paginator(estoque_com_borda, 9)
+    # ========== PAGINAÇÃO (só os 9 lotes da página saem do banco) ==========
+    paginator = Paginator(estoque_qs, 9)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
 
@@ -810,9 +639,6 @@ def estoque(request):
         "validade": validade,
         "categorias": categorias,
         "categoria_id": categoria_id,
-        "todos_produtos_json": todos_produtos_json,
-        "estoque_json": estoque_json,
-
     }
 
     return render(request, "estoque.html", contexto)
@@ -873,38 +699,42 @@ def quitar_venda(request, venda_id):
     if request.method != "POST":
         return JsonResponse({"success": False, "error": "Método inválido"})
 
-    try:
-        venda = Venda.objects.get(id=venda_id)
-    except Venda.DoesNotExist:
-        return JsonResponse({"success": False, "error": "Venda não encontrada"})
-
     try:
         data = json.loads(request.body)
         nova_forma = data.get("forma_pagamento")
         if not nova_forma or nova_forma == "pendente":
             return JsonResponse({"success": False, "error": "Forma de pagamento inválida"})
 
-        # Valores como Decimal
-        valor_bruto = Decimal(str(venda.valor_bruto or "0.00"))
-        desconto_total = Decimal(str(venda.desconto_total or "0.00"))
-        valor_com_desconto = max(valor_bruto - desconto_total, Decimal("0.00"))
-
-        # Taxa baseada na forma de pagamento
-        taxa_percentual = TAXAS.get(nova_forma, Decimal("0.00"))
-        taxa_aplicada = (valor_com_desconto * taxa_percentual / Decimal("100")).quantize(
-            Decimal("0.01"), rounding=ROUND_HALF_UP
-        )
+        with transaction.atomic():
+            # Trava a venda: dois cliques/terminais quitando ao mesmo tempo não cobram duas vezes
+            try:
+                venda = Venda.objects.select_for_update().get(id=venda_id)
+            except Venda.DoesNotExist:
+                return JsonResponse({"success": False, "error": "Venda não encontrada"})
+            if venda.forma_pagamento != "pendente":
+                return JsonResponse({"success": False, "error": "Venda já foi quitada"})
+
+            # Valores como Decimal
+            valor_bruto = Decimal(str(venda.valor_bruto or "0.00"))
+            desconto_total = Decimal(str(venda.desconto_total or "0.00"))
+            valor_com_desconto = max(valor_bruto - desconto_total, Decimal("0.00"))
+
+            # Taxa baseada na forma de pagamento
+            taxa_percentual = TAXAS.get(nova_forma, Decimal("0.00"))
+            taxa_aplicada = (valor_com_desconto * taxa_percentual / Decimal("100")).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
 
-        # Valor líquido após taxa
-        valor_liquido = (valor_com_desconto - taxa_aplicada).quantize(
-            Decimal("0.01"), rounding=ROUND_HALF_UP
-        )
+            # Valor líquido após taxa
+            valor_liquido = (valor_com_desconto - taxa_aplicada).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
 
-        # Atualiza venda
-        venda.forma_pagamento = nova_forma
-        venda.taxa = taxa_aplicada
-        venda.valor_liquido = valor_liquido
-        venda.save()
+            # Atualiza venda
+            venda.forma_pagamento = nova_forma
+            venda.taxa = taxa_aplicada
+            venda.valor_liquido = valor_liquido
+            venda.save()
 
         return JsonResponse({
             "success": True,
@@ -936,14 +766,65 @@ import json
 
 # Assuma que Venda.FORMAS_PAGAMENTO e Venda estão definidos em outro lugar.
 
-def dash_vendas(request):
+from django.db.models import Prefetch, DecimalField, Count, Value
+from django.db.models.functions import Coalesce
+from .models import ItemVenda
+
+
+def resumo_vendas(vendas):
+    """
+    Totais do cabeçalho do dash de vendas em uma única consulta (agregações condicionais):
+    quantidade de vendas pagas/pendentes, somas das pagas e o detalhe por forma de pagamento.
+    """
+    pagas = ~Q(forma_pagamento="pendente")
+    pendentes = Q(forma_pagamento="pendente")
+
+    def soma(campo, filtro):
+        return Coalesce(Sum(campo, filter=filtro), Value(Decimal("0")), output_field=DecimalField())
+
+    agregados = {
+        "quantidade": Count("pk"),
+        "pagas": Count("pk", filter=pagas),
+        "pendentes": Count("pk", filter=pendentes),
+        "total_bruto": soma("valor_bruto", pagas),
+        "total_liquido": soma("valor_liquido", pagas),
+        "total_taxa": soma("taxa", pagas),
+        "total_desconto": soma("desconto_total", pagas),
+        "total_pendente": soma("valor_bruto", pendentes),
+    }
+    for codigo, _ in Venda.FORMAS_PAGAMENTO:
+        filtro = Q(forma_pagamento=codigo)
+        agregados[f"{codigo}__quantidade"] = Count("pk", filter=filtro)
+        agregados[f"{codigo}__bruto"] = soma("valor_bruto", filtro)
+        agregados[f"{codigo}__liquido"] = soma("valor_liquido", filtro)
+
+    resumo = vendas.order_by().aggregate(**agregados)
+    resumo["formas"] = [
+        {
+            "codigo": codigo,
+            "nome": nome,
+            "quantidade": resumo.pop(f"{codigo}__quantidade"),
+            "bruto": resumo.pop(f"{codigo}__bruto"),
+            "liquido": resumo.pop(f"{codigo}__liquido"),
+        }
+        for codigo, nome in Venda.FORMAS_PAGAMENTO
+    ]
+    return resumo
+
+
+def filtrar_vendas(params):
+    """
+    Aplica os filtros do dash de vendas (periodo, status_pagamento, forma_pagamento) vindos de
+    `params` (request.GET). Devolve as vendas filtradas e os valores para repopular o formulário.
+    Usado pelo dash_vendas e pela exportação em CSV.
+    """
     # Base QuerySet
     vendas_list = Venda.objects.all().order_by("-data")
 
     # --- Recebe filtros ---
-    periodo_submetido = request.GET.get("periodo")
-    status_pagamento = request.GET.get("status_pagamento", "todos")
-    forma_pagamento_filtro = request.GET.get("forma_pagamento", "")
+    periodo_submetido = params.get("periodo")
+    status_pagamento = params.get("status_pagamento", "todos")
+    forma_pagamento_filtro = params.get("forma_pagamento", "")
 
     data_inicio_obj = data_fim_obj = None
     data_inicio_context = data_fim_context = ""  # Variáveis para o template (iniciais vazias)
@@ -980,10 +861,7 @@ def dash_vendas(request):
         if data_inicio_obj > data_fim_obj:
             data_inicio_obj, data_fim_obj = data_fim_obj, data_inicio_obj  # Garante a ordem correta
 
-        vendas_list = vendas_list.filter(
-            data__date__gte=data_inicio_obj,
-            data__date__lte=data_fim_obj
-        )
+        vendas_list = vendas_list.filter(**periodo("data", data_inicio_obj, data_fim_obj))
         dias_intervalo = (data_fim_obj - data_inicio_obj).days + 1
     else:
         dias_intervalo = None
@@ -1001,47 +879,59 @@ def dash_vendas(request):
         elif status_pagamento == "pendentes":
             vendas_list = vendas_list.filter(forma_pagamento="pendente")
 
-    # Filtra para totais apenas vendas pagas
-    vendas_totais = vendas_list.exclude(forma_pagamento="pendente")
+    return {
+        "vendas": vendas_list,
+        # ✅ data_inicio e data_fim virão vazias na primeira carga ou se o filtro for limpo.
+        "data_inicio": data_inicio_context,
+        "data_fim": data_fim_context,
+        "dias_intervalo": dias_intervalo,
+        "status_pagamento": status_pagamento,
+        "forma_pagamento_filtro": forma_pagamento_filtro,
+    }
+
 
-    # --- Totais filtrados (somente vendas pagas) ---
-    total_bruto = vendas_totais.aggregate(Sum("valor_bruto"))["valor_bruto__sum"] or 0
-    total_liquido = vendas_totais.aggregate(Sum("valor_liquido"))["valor_liquido__sum"] or 0
+def dash_vendas(request):
+    filtros = filtrar_vendas(request.GET)
+    vendas_list = filtros["vendas"]
 
-    # --- Paginação ---
-    paginator = Paginator(vendas_list, 30)
-    page_number = request.GET.get("page")
-    vendas = paginator.get_page(page_number)
+    # --- Totais filtrados (somas só das vendas pagas), numa consulta só ---
+    resumo = resumo_vendas(vendas_list)
+
+    # --- Paginação por cursor (data, id) ---
+    # Itens só das vendas da página (uma consulta), não do histórico filtrado inteiro
+    vendas = paginar_keyset(
+        vendas_list.select_related("usuario").prefetch_related(
+            Prefetch("itens", queryset=ItemVenda.objects.select_related("produto"))
+        ),
+        ["-data", "-id"], request.GET, 30
+    )
 
     # --- Formas de Pagamento para o <select> ---
     formas_pagamento_choices = Venda.FORMAS_PAGAMENTO
 
-    # --- Serializa itens (mantido como original) ---
-    vendas_itens_json = {}
-    for venda_obj in vendas_list:
-        itens = []
-        for item in venda_obj.itens.select_related('produto').all():
-            itens.append({
+    # --- Serializa itens da página ---
+    vendas_itens = {
+        venda_obj.id: [
+            {
                 "produto": item.produto.nome_produto,
                 "quantidade": item.quantidade,
                 "valor_unitario": float(item.valor_unitario),
                 "desconto": float(item.desconto),
                 "valor_total": float(item.valor_total),
-            })
-        vendas_itens_json[venda_obj.id] = itens
+            }
+            for item in venda_obj.itens.all()
+        ]
+        for venda_obj in vendas
+    }
 
     context = {
+        **filtros,
         "vendas": vendas,
-        # ✅ data_inicio e data_fim virão vazias na primeira carga ou se o filtro for limpo.
-        "data_inicio": data_inicio_context,
-        "data_fim": data_fim_context,
-        "dias_intervalo": dias_intervalo,
-        "status_pagamento": status_pagamento,
-        "forma_pagamento_filtro": forma_pagamento_filtro,
         "formas_pagamento_choices": formas_pagamento_choices,
-        "total_bruto": total_bruto,
-        "total_liquido": total_liquido,
-        "vendas_itens_json": json.dumps(vendas_itens_json),
+        "resumo": resumo,
+        "total_bruto": resumo["total_bruto"],
+        "total_liquido": resumo["total_liquido"],
+        "vendas_itens": vendas_itens,
     }
     return render(request, "dash_vendas.html", context)
 
@@ -1053,12 +943,84 @@ import json
 from django.db.models.functions import TruncDate
 
 
+import csv
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
+
+
+class _Eco:
+    """Arquivo falso para o csv.writer: devolve a linha em vez de gravar."""
+    def write(self, valor):
+        return valor
+
+
+def _valor_csv(valor):
+    return f"{valor:.2f}".replace(".", ",") if valor is not None else ""
+
+
+@login_required(login_url='login')
+def exportar_vendas_csv(request):
+    """
+    Vendas com seus itens em CSV (uma linha por item), com os mesmos filtros do dash de vendas.
+    Gerado aos poucos: as vendas são lidas em blocos (cursor no servidor no Postgres),
+    então um ano inteiro sai com memória constante.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Acesso negado."}, status=403)
+
+    vendas = (
+        filtrar_vendas(request.GET)["vendas"]
+        .select_related("usuario")
+        .prefetch_related(Prefetch("itens", queryset=ItemVenda.objects.select_related("produto").order_by("pk")))
+    )
+    escritor = csv.writer(_Eco(), delimiter=";")
+
+    def linhas():
+        yield "\ufeff"  # BOM para o Excel reconhecer UTF-8
+        yield escritor.writerow([
+            "venda", "data", "usuario", "cliente", "forma_pagamento", "valor_bruto", "desconto_total", "taxa",
+            "valor_liquido", "produto", "codigo", "quantidade", "valor_unitario", "desconto_item", "valor_total",
+        ])
+        for venda in vendas.iterator(chunk_size=2000):
+            dados_venda = [
+                venda.id,
+                timezone.localtime(venda.data).strftime("%d/%m/%Y %H:%M"),
+                venda.usuario.username if venda.usuario else "",
+                venda.nome_cliente or "",
+                venda.get_forma_pagamento_display(),
+                _valor_csv(venda.valor_bruto),
+                _valor_csv(venda.desconto_total),
+                _valor_csv(venda.taxa),
+                _valor_csv(venda.valor_liquido),
+            ]
+            itens = venda.itens.all()
+            if not itens:
+                yield escritor.writerow(dados_venda + [""] * 6)
+            for item in itens:
+                yield escritor.writerow(dados_venda + [
+                    item.produto.nome_produto,
+                    item.produto.codigo or "",
+                    item.quantidade,
+                    _valor_csv(item.valor_unitario),
+                    _valor_csv(item.desconto),
+                    _valor_csv(item.valor_total),
+                ])
+
+    resposta = StreamingHttpResponse(linhas(), content_type="text/csv; charset=utf-8")
+    resposta["Content-Disposition"] = f'attachment; filename="vendas_{timezone.localdate():%Y%m%d}.csv"'
+    return resposta
+
+
+from .models import VendaDiaria
+
+
 def dash_vendas_graficos(request):
     periodo = request.GET.get("periodo", "")
     dia_semana = request.GET.get("dia_semana", "todos")
 
     data_inicio = data_fim = None
-    vendas_query = Venda.objects.all()
+    # Lê do resumo diário (uma linha por dia/forma/usuário), não das vendas uma a uma
+    vendas_query = VendaDiaria.objects.all()
 
     # filtro por período
     if periodo:
@@ -1067,7 +1029,7 @@ def dash_vendas_graficos(request):
             try:
                 data_inicio = datetime.strptime(partes[0].strip(), "%d/%m/%Y").date()
                 data_fim = datetime.strptime(partes[1].strip(), "%d/%m/%Y").date()
-                vendas_query = vendas_query.filter(data__date__range=[data_inicio, data_fim])
+                vendas_query = vendas_query.filter(dia__range=[data_inicio, data_fim])
             except ValueError:
                 pass
 
@@ -1078,19 +1040,19 @@ def dash_vendas_graficos(request):
             "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6
         }
         if dia_semana in semana_map:
-            vendas_query = vendas_query.filter(data__week_day=semana_map[dia_semana] + 1)
+            vendas_query = vendas_query.filter(dia__week_day=semana_map[dia_semana] + 1)
 
     # --- GRÁFICO 1: VENDAS POR DIA ---
     vendas_por_dia = (
         vendas_query
-        .annotate(day=TruncDate("data"))
-        .values("day")
-        .annotate(total=Count("id"))
-        .order_by("day")
+        .values("dia")
+        .annotate(total=Sum("quantidade"))
+        .filter(total__gt=0)
+        .order_by("dia")
     )
 
     if vendas_por_dia:
-        grafico1_labels = [v["day"].strftime("%d/%m/%Y") for v in vendas_por_dia]
+        grafico1_labels = [v["dia"].strftime("%d/%m/%Y") for v in vendas_por_dia]
         grafico1_values = [v["total"] for v in vendas_por_dia]
         mensagem = ""
     else:
@@ -1110,7 +1072,8 @@ def dash_vendas_graficos(request):
     vendas_por_forma = (
         vendas_query
         .values("forma_pagamento")
-        .annotate(total=Count("id"))
+        .annotate(total=Sum("quantidade"))
+        .filter(total__gt=0)
         .order_by("-total")
     )
 
@@ -1129,7 +1092,7 @@ def dash_vendas_graficos(request):
         vendas_query
         .exclude(usuario__isnull=True)
         .values("usuario__username")
-        .annotate(total_vendas=Sum("valor_liquido"))  # soma o valor líquido vendido
+        .annotate(total_vendas=Sum("total_liquido"))  # soma o valor líquido vendido
         .order_by("-total_vendas")[:10]  # pega top 10 usuários
     )
 
@@ -1190,26 +1153,23 @@ def dashboard_estoque(request):
 
     chart_data_json = json.dumps(chart_data) if chart_data else None
 
-    # 🧮 Cálculos financeiros do estoque
-    estoque = Estoque.objects.select_related('produtos')
-
-    ganho_potencial_estoque = estoque.aggregate(
-        total=Sum(
+    # 🧮 Cálculos financeiros do estoque (pelo saldo de cada produto, sem somar lote a lote)
+    totais_estoque = Produtos.objects.aggregate(
+        ganho=Sum(
             ExpressionWrapper(
-                F('quantidade') * F('produtos__ganho_potencial'),
+                F('estoque_atual') * F('ganho_potencial'),
                 output_field=DecimalField()
             )
-        )
-    )['total'] or 0
-
-    valor_parado_estoque = estoque.aggregate(
-        total=Sum(
+        ),
+        parado=Sum(
             ExpressionWrapper(
-                F('quantidade') * F('produtos__preco_fornecedor'),
+                F('estoque_atual') * F('preco_fornecedor'),
                 output_field=DecimalField()
             )
-        )
-    )['total'] or 0
+        ),
+    )
+    ganho_potencial_estoque = totais_estoque['ganho'] or 0
+    valor_parado_estoque = totais_estoque['parado'] or 0
 
     context = {
         "chart_data": chart_data_json,
@@ -1241,20 +1201,15 @@ def financeiro_mensal(request):
     ano = int(request.GET.get('ano', datetime.now().year))
 
     # Despesas do mês
-    despesas = Despesa.objects.filter(
-        data__year=ano,
-        data__month=mes
-    ).select_related('categoria')
+    despesas = Despesa.objects.filter(data__range=dias_do_mes(mes, ano)).select_related('categoria')
 
     # Vendas e itens
-    vendas = Venda.objects.filter(data__year=ano, data__month=mes)
+    vendas = Venda.objects.filter(**periodo("data", *dias_do_mes(mes, ano)))
     total_liquido = vendas.aggregate(Sum('valor_liquido'))['valor_liquido__sum'] or 0
 
-    itens = ItemVenda.objects.filter(venda__in=vendas).select_related('produto')
-    total_ganho_potencial = sum(
-        (item.produto.ganho_potencial or 0) * item.quantidade
-        for item in itens
-    )
+    total_ganho_potencial = ItemVenda.objects.filter(venda__in=vendas).aggregate(
+        total=ItemVenda.ganho_total()
+    )['total']
 
     total_despesas = despesas.aggregate(Sum('valor'))['valor__sum'] or 0
     lucro_liquido = total_liquido - total_despesas
@@ -1272,15 +1227,12 @@ def financeiro_mensal(request):
 
     fechamentos = FinanceiroMes.objects.all()
 
-    FinanceiroMes.gerar_ou_atualizar(mes, ano)
-
     context = {
         'form': form,
         'despesas': despesas,
         'mes': mes,
         'ano': ano,
         'vendas': vendas,
-        'itens': itens,
         'total_liquido': round(total_liquido, 2),
         'total_ganho_potencial': round(total_ganho_potencial, 2),
         'total_despesas': round(total_despesas, 2),
@@ -1295,18 +1247,6 @@ def financeiro_mensal(request):
     return render(request, 'dash_balanco.html', context)
 
 
-@csrf_exempt
-def excluir_produto(request, produto_id):
-    if request.method == 'POST':  # trocado DELETE por POST
-        try:
-            produto = Produtos.objects.get(id=produto_id)
-            produto.delete()
-            return JsonResponse({'success': True, 'message': '✅ Produto excluído com sucesso!'})
-        except Produtos.DoesNotExist:
-            return JsonResponse({'success': False, 'message': '❌ Produto não encontrado.'}, status=404)
-    return JsonResponse({'success': False, 'message': 'Método inválido.'}, status=405)
-
-
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 
@@ -1378,15 +1318,15 @@ def dash_stock(request):
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
 
-    if start_date:
-        # filtra por data maior ou igual à start_date
-        saidas = saidas.filter(data_saida__date__gte=parse_date(start_date))
-    if end_date:
-        # filtra por data menor ou igual à end_date
-        saidas = saidas.filter(data_saida__date__lte=parse_date(end_date))
+    # filtra entre start_date e end_date (inclusive)
+    saidas = saidas.filter(**periodo(
+        "data_saida",
+        parse_date(start_date) if start_date else None,
+        parse_date(end_date) if end_date else None,
+    ))
 
     context = {
-        "saidas": saidas,
+        "saidas": paginar_keyset(saidas, ["-data_saida", "-id"], request.GET, 50),
         "request": request  # necessário para manter os valores do filtro no template
     }
     return render(request, "dash_stock.html", context)
@@ -1454,8 +1394,8 @@ from datetime import datetime, timedelta
 
 def dash_stock_grafico(request):
     # Captura os parâmetros do GET
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
     period = request.GET.get('period')
 
     # Filtra os dados de acordo com os parâmetros
@@ -1477,10 +1417,7 @@ def dash_stock_grafico(request):
         elif period == 'todos':
             start_date = end_date = None
 
-    if start_date:
-        saidas = saidas.filter(data_saida__date__gte=start_date)
-    if end_date:
-        saidas = saidas.filter(data_saida__date__lte=end_date)
+    saidas = saidas.filter(**periodo("data_saida", start_date, end_date))
 
     # Agrupa por nome de produto
     data = saidas.values('nome_produto').annotate(total=Sum('quantidade')).order_by('nome_produto')
@@ -1499,60 +1436,39 @@ from django.shortcuts import render
 from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta
-from .models import Venda, ItemVenda, SaidaEstoque
+import math
+from .models import Venda, ItemVenda, SaidaEstoque, PrevisaoDemanda
 
 
 def lista_compras(request):
     # Captura o filtro de dias do GET
-    dias = int(request.GET.get('dias', 3))  # padrão: 3 dias
-    hoje = timezone.now().date()
-
-    # Calcular datas do histórico de 3 semanas
-    semanas = 3
-    historico_inicio = hoje - timedelta(weeks=semanas)
-
-    # Filtra vendas e saídas dentro das últimas 3 semanas
-    vendas_recente = ItemVenda.objects.filter(
-        venda__data__date__gte=historico_inicio
-    ).values('produto__nome_produto').annotate(
-        total_vendido=Sum('quantidade')
-    )
-
-    saidas_recente = SaidaEstoque.objects.filter(
-        data_saida__date__gte=historico_inicio
-    ).values('nome_produto').annotate(
-        total_saida=Sum('quantidade')
-    )
-
-    # Criar um dicionário para somar todas as quantidades por produto
-    produtos_hist = {}
-
-    for item in vendas_recente:
-        nome = item['produto__nome_produto']
-        produtos_hist[nome] = produtos_hist.get(nome, 0) + item['total_vendido']
+    dias = max(int(request.GET.get('dias', 3)), 1)  # padrão: 3 dias
+    hoje = timezone.localdate()
 
-    for item in saidas_recente:
-        nome = item['nome_produto']
-        produtos_hist[nome] = produtos_hist.get(nome, 0) + item['total_saida']
+    # Previsão por dia da semana calculada toda noite (comando calcular_previsoes);
+    # aqui só soma os próximos `dias` dias e desconta o que já está em estoque
+    previsoes = PrevisaoDemanda.objects.select_related('produto').order_by()
 
-    # Calcula média diária para cada produto e estima quantidade para X dias
     produtos_estimativa = []
-    for nome, total in produtos_hist.items():
-        media_diaria = total / (semanas * 7)  # média por dia
-        quantidade_sugerida = round(media_diaria * dias)
+    for previsao in previsoes:
+        demanda = previsao.demanda_em(hoje, dias)
+        estoque_atual = previsao.produto.estoque_atual
         produtos_estimativa.append({
-            'produto': nome,
-            'media_diaria': round(media_diaria, 2),
+            'produto': previsao.produto.nome_produto,
+            'media_diaria': round(previsao.media_diaria, 2),
+            'demanda_prevista': round(demanda, 1),
+            'estoque_atual': estoque_atual,
             'dias': dias,
-            'quantidade_sugerida': quantidade_sugerida
+            'quantidade_sugerida': max(math.ceil(demanda - estoque_atual), 0),
         })
 
-    # Ordena produtos por quantidade sugerida (opcional)
-    produtos_estimativa.sort(key=lambda x: -x['quantidade_sugerida'])
+    # Ordena produtos por quantidade sugerida
+    produtos_estimativa.sort(key=lambda x: (-x['quantidade_sugerida'], -x['demanda_prevista'], x['produto']))
 
     context = {
         'produtos_estimativa': produtos_estimativa,
-        'dias': dias
+        'dias': dias,
+        'calculado_em': max((p.atualizado for p in previsoes), default=None),
     }
     return render(request, 'dash_compras.html', context)
 
@@ -1644,3 +1560,31 @@ def criar_usuario_padrao(request):
         )
         return JsonResponse({"success": True, "message": "Usuário joyboy criado com sucesso!"})
     return JsonResponse({"success": False, "message": "Método não permitido."})
+
+
+from .models import Tarefa
+
+
+@login_required(login_url='login')
+def status_tarefas(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Acesso negado."}, status=403)
+
+    contagem = defaultdict(dict)
+    for linha in Tarefa.objects.values("tipo", "status").annotate(total=Count("id")).order_by("tipo"):
+        contagem[linha["tipo"]][linha["status"]] = linha["total"]
+
+    atrasada = (
+        Tarefa.objects.filter(status="pendente", executar_em__lte=timezone.now())
+        .order_by("executar_em").values_list("executar_em", flat=True).first()
+    )
+    falhas = list(
+        Tarefa.objects.filter(status="falhou").order_by("-atualizado")
+        .values("id", "tipo", "tentativas", "erro", "atualizado")[:20]
+    )
+
+    return JsonResponse({
+        "tarefas": contagem,
+        "pendente_desde": atrasada,
+        "falhas": falhas,
+    }, encoder=DjangoJSONEncoder)